@@ -1,12 +1,28 @@
+import argparse
 import datetime
 import calendar
+import functools
 import time
 import os
-import pandas as pd
-
-from scrape_wikidata.query_wikidata import query_with_date, QUERY_HUMAN
+from collections import Counter
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from scrape_wikidata.concurrent_scrape import ConcurrentScraper
+from scrape_wikidata.manifest import ScrapeManifest, ProgressReporter
+from scrape_wikidata.query_wikidata import (
+    DateBatchPlanner,
+    PERSONS_RAW_SCHEMA,
+    QUERY_HUMAN,
+    conform_to_schema,
+    endpoint_url,
+    scrape_dates_adaptive,
+)
 from path_fns.filepaths import (
     PERSONS_BY_DOD_RAW_OUT_PATH,
+    PERSONS_BY_DOD_RAW_STAGING_PATH,
+    SCRAPE_MANIFEST_PATH,
     persons_by_dob_raw_filename_year_month,
     persons_by_dob_raw_filename_full_year,
 )
@@ -14,9 +30,6 @@ from path_fns.filepaths import (
 from pathlib import Path
 
 
-Path(PERSONS_BY_DOD_RAW_OUT_PATH).mkdir(parents=True, exist_ok=True)
-
-
 def days_in_month(year, month):
     num_days = calendar.monthrange(year, month)[1]
     date_list = [datetime.date(year, month, day) for day in range(1, num_days + 1)]
@@ -24,49 +37,152 @@ def days_in_month(year, month):
     return date_list
 
 
-# Lots of records - output in groups of 1 month
-for year in range(2000, 1700, -1):
-    for month in range(12, 0, -1):
-        date_list = days_in_month(year, month)
-        filename = persons_by_dob_raw_filename_year_month(year, month)
-        dfs = []
-        start_time = time.time()
-        if not os.path.exists(filename):
-            for this_date in date_list:
-                print(f"Scraping date {this_date}")
-                df = query_with_date(QUERY_HUMAN, this_date)
-                print(f"done {this_date} with record count {len(df)}")
-                if len(df) > 0:
-                    dfs.append(df)
-
-            df = pd.concat(dfs)
-            df.to_parquet(filename)
-
-            end_time = time.time()
-
-            print(f"Time taken: {end_time - start_time}")
-
-# Few records - output in groups of 1 year
-for year in range(1700, -2000, -1):
-    print(f"Starting year {year}")
-
-    filename = persons_by_dob_raw_filename_full_year(year)
-    if not os.path.exists(filename):
-        dfs = []
-        start_time = time.time()
+# Units in the manifest are dates of death, and completed output files
+DATES_SCRAPE = "persons_by_dod"
+FILES_SCRAPE = "persons_by_dod_files"
+
+
+def stage_batch(manifest, progress, dates, table):
+    """Write the result for a batch of dates to a staging file, and record
+    the dates as complete in the manifest
+    """
+    path = os.path.join(
+        PERSONS_BY_DOD_RAW_STAGING_PATH, f"dod_{dates[0]}_{len(dates)}_dates.parquet"
+    )
+    pq.write_table(conform_to_schema(table, PERSONS_RAW_SCHEMA), path)
+
+    rows_per_date = Counter(
+        d.split("T")[0].lstrip("+") for d in table["dod"].to_pylist()
+    )
+    manifest.record(DATES_SCRAPE, {d: rows_per_date[d] for d in dates}, path)
+
+    progress.update(len(dates), len(table))
+    print(progress.report())
+
+
+def scrape_dates_to_file(scrape_fn, manifest, progress, date_list, filename):
+    if manifest.is_complete(FILES_SCRAPE, filename):
+        return
+
+    Path(filename).parent.mkdir(parents=True, exist_ok=True)
+
+    # Files written before there was a manifest are complete
+    if os.path.exists(filename):
+        manifest.record(FILES_SCRAPE, {filename: pq.read_metadata(filename).num_rows})
+        return
+
+    # Files written before the raw persons data was partitioned are complete,
+    # but may be missing columns
+    legacy_filename = os.path.join(
+        PERSONS_BY_DOD_RAW_OUT_PATH, os.path.basename(filename)
+    )
+    if os.path.exists(legacy_filename):
+        table = conform_to_schema(pq.read_table(legacy_filename), PERSONS_RAW_SCHEMA)
+        pq.write_table(table, filename)
+        manifest.record(FILES_SCRAPE, {filename: len(table)}, filename)
+        os.remove(legacy_filename)
+        return
+
+    start_time = time.time()
+
+    # Only scrape the dates that weren't completed by a previous run
+    completed_dates = manifest.completed_units(DATES_SCRAPE)
+    remaining_dates = [d for d in date_list if d not in completed_dates]
+    if remaining_dates:
+        print(
+            f"Scraping {len(remaining_dates)} dates from {date_list[0]} to {filename}"
+        )
+        scrape_fn(
+            remaining_dates,
+            on_batch=functools.partial(stage_batch, manifest, progress),
+        )
+
+    staging_paths = manifest.paths(DATES_SCRAPE, date_list)
+    tables = [
+        conform_to_schema(pq.read_table(p), PERSONS_RAW_SCHEMA) for p in staging_paths
+    ]
+    table = pa.concat_tables(tables)
+    pq.write_table(table, filename)
+    manifest.record(FILES_SCRAPE, {filename: len(table)}, filename)
+
+    # The staging files are only read to build the output file, which is now
+    # complete
+    for path in staging_paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+    end_time = time.time()
+
+    print(f"done {len(date_list)} dates with record count {len(table)}")
+    print(f"Time taken: {end_time - start_time}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=4,
+        help="Maximum number of requests in flight at once",
+    )
+    parser.add_argument(
+        "--requests_per_second",
+        type=float,
+        default=2.0,
+        help="Maximum rate at which requests are started",
+    )
+    parser.add_argument("--max_retries", type=int, default=6)
+    parser.add_argument("--timeout", type=int, default=120)
+    parser.add_argument(
+        "--endpoint",
+        default=endpoint_url,
+        help="SPARQL endpoint e.g. a local stand in for testing",
+    )
+    args = parser.parse_args()
+
+    Path(PERSONS_BY_DOD_RAW_OUT_PATH).mkdir(parents=True, exist_ok=True)
+    Path(PERSONS_BY_DOD_RAW_STAGING_PATH).mkdir(parents=True, exist_ok=True)
+
+    scraper = ConcurrentScraper(
+        max_workers=args.max_workers,
+        requests_per_second=args.requests_per_second,
+        max_retries=args.max_retries,
+    )
+    # The planner is shared by all files, so how densely dates are packed into
+    # each request adapts as the scrape moves back in time
+    planner = DateBatchPlanner()
+    scrape_fn = functools.partial(
+        scrape_dates_adaptive,
+        QUERY_HUMAN,
+        planner=planner,
+        map_fn=scraper.map,
+        call=scraper.call,
+        endpoint_url=args.endpoint,
+        timeout=args.timeout,
+    )
+
+    # Lots of records - output in groups of 1 month
+    files_to_scrape = []
+    for year in range(2000, 1700, -1):
         for month in range(12, 0, -1):
             date_list = days_in_month(year, month)
+            filename = persons_by_dob_raw_filename_year_month(year, month)
+            files_to_scrape.append((date_list, filename))
 
-            for this_date in date_list:
-                print(f"Scraping date {this_date}")
-                df = query_with_date(QUERY_HUMAN, this_date)
-                print(f"done {this_date} with record count {len(df)}")
-                if len(df) > 0:
-                    dfs.append(df)
-
-        df = pd.concat(dfs)
-        df.to_parquet(filename)
-
-        end_time = time.time()
-
-        print(f"Time taken: {end_time - start_time}")
+    # Few records - output in groups of 1 year.  datetime only supports years
+    # from 1 onwards
+    for year in range(1700, 0, -1):
+        date_list = []
+        for month in range(12, 0, -1):
+            date_list.extend(days_in_month(year, month))
+        filename = persons_by_dob_raw_filename_full_year(year)
+        files_to_scrape.append((date_list, filename))
+
+    manifest = ScrapeManifest(SCRAPE_MANIFEST_PATH)
+    progress = ProgressReporter(
+        total_units=sum(len(date_list) for date_list, _ in files_to_scrape),
+        already_done=manifest.summary(DATES_SCRAPE)[0],
+    )
+
+    for date_list, filename in files_to_scrape:
+        scrape_dates_to_file(scrape_fn, manifest, progress, date_list, filename)
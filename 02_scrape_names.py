@@ -1,18 +1,25 @@
 # %%
+import glob
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scrape_wikidata.concurrent_scrape import ConcurrentScraper
+from scrape_wikidata.manifest import ScrapeManifest
 from scrape_wikidata.names import (
     SQL_GN_SAID_TO_BE_SAME_AS,
     SQL_FN_SAID_TO_BE_SAME_AS,
     SQL_GN_NICKNAME,
     SQL_GN_SHORTNAME,
     SQL_HYPOCORISM,
-    get_standardised_table,
+    get_standardised_pages,
     get_diminutives,
 )
 
 from path_fns.filepaths import (
     NAMES_RAW_OUT_PATH_GIVEN_NAME,
     NAMES_RAW_OUT_PATH_FAMILY_NAME,
+    SCRAPE_MANIFEST_PATH,
 )
 
 from pathlib import Path
@@ -20,114 +27,120 @@ from pathlib import Path
 Path(NAMES_RAW_OUT_PATH_GIVEN_NAME).mkdir(parents=True, exist_ok=True)
 Path(NAMES_RAW_OUT_PATH_FAMILY_NAME).mkdir(parents=True, exist_ok=True)
 
-# %%
-
-# Scrape first name said to be the same as
-for page in range(0, 100, 1):
-    pagesize = 5000
-    path = os.path.join(
-        NAMES_RAW_OUT_PATH_GIVEN_NAME,
-        f"stbtsa_page_{page}_{page*pagesize}_to_{(page+1)*pagesize-1}.parquet",
+manifest = ScrapeManifest(SCRAPE_MANIFEST_PATH)
+
+# All requests share one rate limit, and are retried if rate limited
+scraper = ConcurrentScraper(requests_per_second=1.0)
+
+
+def remove_offset_pages(out_dir, prefix):
+    """Delete the pages of an earlier scrape paged by offset, and forget them in
+    the manifest, once the keyset scrape which replaces them is complete.
+    They'd otherwise be read alongside it in step 04
+    """
+    for path in glob.glob(os.path.join(out_dir, f"{prefix}_page_*.parquet")):
+        os.remove(path)
+    manifest.clear(f"names/{os.path.basename(out_dir)}/{prefix}")
+
+
+def scrape_pages(query, name_variant, entity_var, out_dir, prefix, pagesize=5000):
+    # Each page is a unit in the manifest, recorded as soon as it is written,
+    # along with the key the next page starts from
+    scrape = f"names/{os.path.basename(out_dir)}/{prefix}_keyset"
+    pages_done = sorted(manifest.units(scrape), key=lambda u: int(u[0]))
+
+    if pages_done:
+        _, _, _, metadata = pages_done[-1]
+        if metadata["next_entity"] is None:
+            remove_offset_pages(out_dir, prefix)
+            return
+        after_entity = metadata["next_entity"]
+    else:
+        after_entity = None
+
+    start_time = time.time()
+    page = len(pages_done)
+    pages = get_standardised_pages(
+        query,
+        name_variant,
+        entity_var,
+        pagesize,
+        after_entity=after_entity,
+        call=scraper.call,
     )
-
-    if not os.path.exists(path):
-        df = get_standardised_table(
-            SQL_GN_SAID_TO_BE_SAME_AS, "said_to_be_the_same_as", page, pagesize
-        )
+    for df, next_entity in pages:
+        path = os.path.join(out_dir, f"{prefix}_keyset_page_{page:05}.parquet")
         df = df.drop_duplicates()
 
         df.to_parquet(
             path,
             index=False,
         )
-
-
-# %%
-
-
-# Scrape first name said to be the same as
-for page in range(0, 100, 1):
-    pagesize = 5000
-
-    path = os.path.join(
-        NAMES_RAW_OUT_PATH_FAMILY_NAME,
-        f"stbtsa_page_{page}_{page*pagesize}_to_{(page+1)*pagesize-1}.parquet",
-    )
-
-    if not os.path.exists(path):
-        df = get_standardised_table(
-            SQL_FN_SAID_TO_BE_SAME_AS, "said_to_be_the_same_as", page, pagesize
+        manifest.record(
+            scrape, {str(page): len(df)}, path, metadata={"next_entity": next_entity}
         )
-        df = df.drop_duplicates()
+        if next_entity is None:
+            # The keyset scrape is complete, so it replaces the offset pages
+            remove_offset_pages(out_dir, prefix)
 
-        df.to_parquet(
-            path,
-            index=False,
-        )
+        page += 1
+        num_units, num_rows = manifest.summary(scrape)
+        elapsed = time.time() - start_time
+        print(f"{scrape}: {num_units} pages, {num_rows:,} rows, {elapsed:.0f}s")
 
 
 # %%
 
-# Scrape given name said to be the same as
-for page in range(0, 100, 1):
-    pagesize = 5000
-    path = os.path.join(
+# The name variant queries are independent, so they are scraped concurrently,
+# each paging through its results one page at a time
+name_scrapes = [
+    # Scrape first name said to be the same as
+    (
+        SQL_GN_SAID_TO_BE_SAME_AS,
+        "said_to_be_the_same_as",
+        "given_name",
         NAMES_RAW_OUT_PATH_GIVEN_NAME,
-        f"nickname_page_{page}_{page*pagesize}_to_{(page+1)*pagesize-1}.parquet",
-    )
-
-    if not os.path.exists(path):
-        df = get_standardised_table(SQL_GN_NICKNAME, "nickname", page, pagesize)
-        df = df.drop_duplicates()
-
-        df.to_parquet(
-            path,
-            index=False,
-        )
-
-# %%
-
-for page in range(0, 100, 1):
-    pagesize = 5000
-    path = os.path.join(
+        "stbtsa",
+    ),
+    # Scrape family name said to be the same as
+    (
+        SQL_FN_SAID_TO_BE_SAME_AS,
+        "said_to_be_the_same_as",
+        "family_name",
+        NAMES_RAW_OUT_PATH_FAMILY_NAME,
+        "stbtsa",
+    ),
+    (
+        SQL_GN_NICKNAME,
+        "nickname",
+        "given_name",
         NAMES_RAW_OUT_PATH_GIVEN_NAME,
-        f"shortname_page_{page}_{page*pagesize}_to_{(page+1)*pagesize-1}.parquet",
-    )
-
-    if not os.path.exists(path):
-        df = get_standardised_table(SQL_GN_SHORTNAME, "shortname", page, pagesize)
-        df = df.drop_duplicates()
-
-        df.to_parquet(
-            path,
-            index=False,
-        )
-
-
-# %%
-for page in range(0, 100, 1):
-    pagesize = 5000
-    path = os.path.join(
+        "nickname",
+    ),
+    (
+        SQL_GN_SHORTNAME,
+        "shortname",
+        "given_name",
         NAMES_RAW_OUT_PATH_GIVEN_NAME,
-        f"hypo_page_{page}_{page*pagesize}_to_{(page+1)*pagesize-1}.parquet",
-    )
-    if not os.path.exists(path):
+        "shortname",
+    ),
+    (SQL_HYPOCORISM, "hypocorism", "of", NAMES_RAW_OUT_PATH_GIVEN_NAME, "hypo"),
+]
 
-        df = get_standardised_table(SQL_HYPOCORISM, "hypocorism", page, pagesize)
-        df = df.drop_duplicates()
-
-        df.to_parquet(
-            path,
-            index=False,
-        )
+with ThreadPoolExecutor(max_workers=len(name_scrapes)) as executor:
+    futures = [executor.submit(scrape_pages, *args) for args in name_scrapes]
+    for future in futures:
+        future.result()
 
 # %%
-diminutives = get_diminutives()
 path = os.path.join(
     NAMES_RAW_OUT_PATH_GIVEN_NAME,
     "scraped_diminutives.parquet",
 )
-diminutives.to_parquet(
-    path,
-    index=False,
-)
+if not manifest.is_complete("names/diminutives", "diminutives"):
+    diminutives = get_diminutives()
+    diminutives.to_parquet(
+        path,
+        index=False,
+    )
+    manifest.record("names/diminutives", {"diminutives": len(diminutives)}, path)
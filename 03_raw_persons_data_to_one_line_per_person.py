@@ -1,154 +1,189 @@
-import duckdb
+import argparse
+import glob
+import os
+
 import pyarrow.parquet as pq
 
+from scrape_wikidata.manifest import ScrapeManifest
+from scrape_wikidata.query_wikidata import PERSON_COLUMNS
+from path_fns.duckdb_connection import get_connection
 from path_fns.filepaths import (
-    PERSONS_BY_DOB_RAW_OUT_PATH,
+    PERSONS_BY_DOD_RAW_GLOB,
     PERSONS_PROCESSED_ONE_ROW_PER_PERSON,
+    SCRAPE_MANIFEST_PATH,
 )
 
-# Using arrow to read because it performs schema merging
-# i.e. if some files are missing a column it doesn't matter
-# duckdb doesn't do this
-arrow_table = pq.read_table(PERSONS_BY_DOB_RAW_OUT_PATH)
-
-con = duckdb.connect(":memory:")
-con.register("df", arrow_table)
+# The raw files that have been built into the output are recorded in the
+# scrape manifest, so later builds only need to process files added since
+BUILD = "persons_one_row_per_person_build"
 
 wikireplace = """replace({col}, 'http://www.wikidata.org/entity/', '') as {col}"""
 cast_date = "TRY_CAST({col} as date) as {col}"
+TRANSFORMS = {"entity": wikireplace, "date": cast_date, None: "{col}"}
 
-sql = f"""
-COPY (
-with nowikiurl as
-(
-select
-    {wikireplace.format(col="human")},
-    {cast_date.format(col="dod")},
-    {wikireplace.format(col="family_name")},
-    {cast_date.format(col="dob")},
-    {wikireplace.format(col="given_name")},
-    {wikireplace.format(col="country_citizen")},
-    {wikireplace.format(col="occupation")},
-    humanLabel,
-    given_nameLabel,
-    family_nameLabel,
-    occupationLabel,
-    country_citizenLabel,
-    sex_or_genderLabel,
-    {wikireplace.format(col="place_birth")},
-    birth_coordinates,
-    {wikireplace.format(col="birth_country")},
-    place_birthLabel,
-    birth_countryLabel,
-    birth_name,
-    humanDescription,
-    name_native_language,
-    humanAltLabel,
-    {wikireplace.format(col="residence")},
-    residence_coordinates,
-    residenceLabel,
-    residence_countryLabel,
-    pseudonym,
-    {wikireplace.format(col="ethnicity")},
-    ethnicityLabel,
-from df
-
-),
-distinct_arrays as (
+AGGREGATED_COLUMNS = [col for col in PERSON_COLUMNS if col.aggregate]
+
+
+def one_row_per_person_sql(source):
+    # Clean each column, then collect the distinct non null values of each
+    # column per human, in a single aggregation
+    cleaned_cols = ",\n    ".join(
+        TRANSFORMS[col.transform].format(col=col.name) for col in AGGREGATED_COLUMNS
+    )
+
+    list_cols = [
+        f"coalesce(list(distinct {col.name}) filter (where {col.name} is not null), [])"
+        f" as {col.name}"
+        for col in AGGREGATED_COLUMNS
+        if col.name != "human"
+    ]
+    list_cols = ",\n    ".join(list_cols)
+
+    return f"""
+with cleaned as (
 select
-    human,
-    list(distinct dod) as dod,
-    list(distinct family_name) as family_name,
-    list(distinct dob) as dob,
-    list(distinct given_name) as given_name,
-    list(distinct country_citizen) as country_citizen,
-    list(distinct occupation) as occupation,
-    list(distinct humanLabel) as humanLabel,
-    list(distinct given_nameLabel) as given_nameLabel,
-    list(distinct family_nameLabel) as family_nameLabel,
-    list(distinct occupationLabel) as occupationLabel,
-    list(distinct country_citizenLabel) as country_citizenLabel,
-    list(distinct sex_or_genderLabel) as sex_or_genderLabel,
-    list(distinct place_birth) as place_birth,
-    list(distinct birth_coordinates) as birth_coordinates,
-    list(distinct birth_country) as birth_country,
-    list(distinct place_birthLabel) as place_birthLabel,
-    list(distinct birth_countryLabel) as birth_countryLabel,
-    list(distinct birth_name) as birth_name,
-    list(distinct humanDescription) as humanDescription,
-    list(distinct name_native_language) as name_native_language,
-    list(distinct humanAltLabel) as humanAltLabel,
-    list(distinct residence) as residence,
-    list(distinct residence_coordinates) as residence_coordinates,
-    list(distinct residenceLabel) as residenceLabel,
-    list(distinct residence_countryLabel) as residence_countryLabel,
-    list(distinct pseudonym) as pseudonym,
-    list(distinct ethnicity) as ethnicity,
-    list(distinct ethnicityLabel) as ethnicityLabel
-from nowikiurl
-group by human
+    {cleaned_cols}
+from {source}
 )
 select
     human,
-    array_filter(dod, x -> x is not null) as dod,
-    array_filter(family_name, x -> x is not null) as family_name,
-    array_filter(dob, x -> x is not null) as dob,
-    array_filter(given_name, x -> x is not null) as given_name,
-    array_filter(country_citizen, x -> x is not null) as country_citizen,
-    array_filter(occupation, x -> x is not null) as occupation,
-    array_filter(humanLabel, x -> x is not null) as humanLabel,
-    array_filter(given_nameLabel, x -> x is not null) as given_nameLabel,
-    array_filter(family_nameLabel, x -> x is not null) as family_nameLabel,
-    array_filter(occupationLabel, x -> x is not null) as occupationLabel,
-    array_filter(country_citizenLabel, x -> x is not null) as country_citizenLabel,
-    array_filter(sex_or_genderLabel, x -> x is not null) as sex_or_genderLabel,
-    array_filter(place_birth, x -> x is not null) as place_birth,
-    array_filter(birth_coordinates, x -> x is not null) as birth_coordinates,
-    array_filter(birth_country, x -> x is not null) as birth_country,
-    array_filter(place_birthLabel, x -> x is not null) as place_birthLabel,
-    array_filter(birth_countryLabel, x -> x is not null) as birth_countryLabel,
-    array_filter(birth_name, x -> x is not null) as birth_name,
-    array_filter(humanDescription, x -> x is not null) as humanDescription,
-    array_filter(name_native_language, x -> x is not null) as name_native_language,
-    array_filter(humanAltLabel, x -> x is not null) as humanAltLabel,
-    array_filter(residence, x -> x is not null) as residence,
-    array_filter(residence_coordinates, x -> x is not null) as residence_coordinates,
-    array_filter(residenceLabel, x -> x is not null) as residenceLabel,
-    array_filter(residence_countryLabel, x -> x is not null) as residence_countryLabel,
-    array_filter(pseudonym, x -> x is not null) as pseudonym,
-    array_filter(ethnicity, x -> x is not null) as ethnicity,
-    array_filter(ethnicityLabel, x -> x is not null) as ethnicityLabel
-from distinct_arrays
-)
-TO '{PERSONS_PROCESSED_ONE_ROW_PER_PERSON}' (FORMAT 'parquet')
-
+    {list_cols}
+from cleaned
+group by human
 """
 
 
-con.execute(sql)
+def read_raw_files_sql(paths):
+    # The raw files all share one schema (see PERSONS_RAW_SCHEMA), so duckdb
+    # can stream them straight from disk, reading only the columns used,
+    # rather than loading the whole raw dataset into memory first
+    paths = ", ".join(f"'{p}'" for p in paths)
+    return f"select * from read_parquet([{paths}], hive_partitioning=1)"
 
 
-import pandas as pd
-
-pd.options.display.max_columns = 1000
-
-display(
+def build_full(con, raw_paths, out_path):
+    con.execute(
+        f"create or replace view raw_persons as {read_raw_files_sql(raw_paths)}"
+    )
     con.execute(
         f"""
-select count(*)
-from '{PERSONS_PROCESSED_ONE_ROW_PER_PERSON}'
-"""
-    ).df()
-)
+        COPY ({one_row_per_person_sql("raw_persons")})
+        TO '{out_path}' (FORMAT 'parquet')
+        """
+    )
 
-# USING SAMPLE 0.01% (bernoulli)
-con.execute(
-    f"""
-select *
-from '{PERSONS_PROCESSED_ONE_ROW_PER_PERSON}'
 
+def build_incremental(con, new_raw_paths, existing_path, out_path):
+    """Aggregate only the new raw files, and merge them into the existing
+    output by human, taking the union of each list column.
 
+    Merging is idempotent, so if a build is interrupted after the output is
+    written but before the files are recorded, rerunning it is harmless
+    """
+    con.execute(
+        f"create or replace view raw_persons as {read_raw_files_sql(new_raw_paths)}"
+    )
 
-limit 1
-"""
-).df().T
+    list_cols = [c for c in pq.read_schema(existing_path).names if c != "human"]
+    merged_cols = [
+        f"""
+        case
+            when d.human is null then e.{col}
+            when e.human is null then d.{col}
+            else list_distinct(list_concat(e.{col}, d.{col}))
+        end as {col}"""
+        for col in list_cols
+    ]
+    merged_cols = ",".join(merged_cols)
+
+    con.execute(
+        f"""
+        COPY (
+            with delta as ({one_row_per_person_sql("raw_persons")})
+            select coalesce(e.human, d.human) as human, {merged_cols}
+            from read_parquet('{existing_path}') as e
+            full outer join delta as d
+            on e.human = d.human
+        )
+        TO '{out_path}' (FORMAT 'parquet')
+        """
+    )
+
+
+def file_metadata(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rebuild from all the raw files, rather than only the new ones",
+    )
+    args = parser.parse_args()
+
+    out_path = PERSONS_PROCESSED_ONE_ROW_PER_PERSON
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = f"{out_path}.tmp"
+
+    manifest = ScrapeManifest(SCRAPE_MANIFEST_PATH)
+    raw_paths = sorted(glob.glob(PERSONS_BY_DOD_RAW_GLOB))
+    built = {path: metadata for _, _, path, metadata in manifest.units(BUILD)}
+
+    # Merging can only add data, so if a raw file that has already been built
+    # has changed or gone, everything is rebuilt
+    changed = [
+        path
+        for path, metadata in built.items()
+        if not os.path.exists(path) or file_metadata(path) != metadata
+    ]
+    new_paths = [path for path in raw_paths if path not in built]
+
+    con = get_connection()
+
+    if args.full or changed or not os.path.exists(out_path):
+        print(f"Building from all {len(raw_paths):,} raw files")
+        manifest.clear(BUILD)
+        build_full(con, raw_paths, tmp_path)
+        paths_built = raw_paths
+    elif new_paths:
+        print(f"Merging {len(new_paths):,} new raw files into {out_path}")
+        build_incremental(con, new_paths, out_path, tmp_path)
+        paths_built = new_paths
+    else:
+        print("No new raw files")
+        paths_built = []
+
+    if paths_built:
+        os.replace(tmp_path, out_path)
+        for path in paths_built:
+            manifest.record(
+                BUILD,
+                {path: pq.read_metadata(path).num_rows},
+                path,
+                metadata=file_metadata(path),
+            )
+
+    print(
+        con.execute(
+            f"""
+    select count(*)
+    from '{out_path}'
+    """
+        ).df()
+    )
+
+    # USING SAMPLE 0.01% (bernoulli)
+    print(
+        con.execute(
+            f"""
+    select *
+    from '{out_path}'
+    limit 1
+    """
+        )
+        .df()
+        .T
+    )
@@ -1,14 +1,20 @@
+import argparse
+
 import pyarrow.parquet as pq
 from transform_master_data.alt_name_lookups import (
+    create_name_frequency_counts,
     get_name_weighted_lookup,
 )
-import duckdb
+from corrupt.compact_name_lookup import write_compact_name_lookup
+from path_fns.duckdb_connection import get_connection
 from path_fns.filepaths import (
     NAMES_RAW_OUT_PATH_GIVEN_NAME,
     NAMES_RAW_OUT_PATH_FAMILY_NAME,
     PERSONS_PROCESSED_ONE_ROW_PER_PERSON,
     NAMES_PROCESSED_GIVEN_NAME_ALT_LOOKUP,
     NAMES_PROCESSED_FAMILY_NAME_ALT_LOOKUP,
+    NAMES_PROCESSED_GIVEN_NAME_ALT_LOOKUP_COMPACT,
+    NAMES_PROCESSED_FAMILY_NAME_ALT_LOOKUP_COMPACT,
 )
 
 # Use the alternative names in out_data/wikidata/raw/names
@@ -19,7 +25,30 @@ from path_fns.filepaths import (
 # |:----------------|:----------------------------------|:-------------------------|
 # | jody            | ['joseph', 'joe', 'judith', 'jo'] | [0.43, 0.23, 0.16, 0.16] |
 
-con = duckdb.connect()
+# Each lookup is also written in a compact memory mappable format, with
+# precomputed alias tables, which is what the corruption functions load
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--sample_percent",
+    type=float,
+    default=None,
+    help="Estimate name frequencies from a random sample of this percent of "
+    "people, which is quicker for very large scrapes",
+)
+args = parser.parse_args()
+
+con = get_connection()
+
+# The frequency of each given and family name in the scraped data is used to
+# weight the alternatives.  Both are counted once, in a single scan
+create_name_frequency_counts(
+    con,
+    ["given_nameLabel", "family_nameLabel"],
+    f"'{PERSONS_PROCESSED_ONE_ROW_PER_PERSON}'",
+    output_table_name="scraped_name_frequency_counts",
+    sample_percent=args.sample_percent,
+)
 
 alt_names_given = pq.read_table(NAMES_RAW_OUT_PATH_GIVEN_NAME)
 con.register("alt_names_given", alt_names_given)
@@ -30,11 +59,14 @@ weighted_lookup_given_name = get_name_weighted_lookup(
     "given_nameLabel",
     "alt_names_given",
     f"'{PERSONS_PROCESSED_ONE_ROW_PER_PERSON}'",
+    tablename_name_frequency_counts="scraped_name_frequency_counts",
 )
-weighted_lookup_given_name = weighted_lookup_given_name.fetch_arrow_table()
 
 
 pq.write_table(weighted_lookup_given_name, NAMES_PROCESSED_GIVEN_NAME_ALT_LOOKUP)
+write_compact_name_lookup(
+    weighted_lookup_given_name, NAMES_PROCESSED_GIVEN_NAME_ALT_LOOKUP_COMPACT
+)
 
 
 alt_names_family = pq.read_table(NAMES_RAW_OUT_PATH_FAMILY_NAME)
@@ -44,7 +76,10 @@ weighted_lookup_family_name = get_name_weighted_lookup(
     "family_nameLabel",
     "alt_names_family",
     f"'{PERSONS_PROCESSED_ONE_ROW_PER_PERSON}'",
+    tablename_name_frequency_counts="scraped_name_frequency_counts",
 )
-weighted_lookup_family_name = weighted_lookup_family_name.fetch_arrow_table()
 
 pq.write_table(weighted_lookup_family_name, NAMES_PROCESSED_FAMILY_NAME_ALT_LOOKUP)
+write_compact_name_lookup(
+    weighted_lookup_family_name, NAMES_PROCESSED_FAMILY_NAME_ALT_LOOKUP_COMPACT
+)
@@ -1,9 +1,13 @@
-import duckdb
+import argparse
+import shutil
+
 import pyarrow.parquet as pq
 from pathlib import Path
 import os
+from path_fns.duckdb_connection import get_connection
 from path_fns.filepaths import (
     TRANSFORMED_MASTER_DATA_ONE_ROW_PER_PERSON,
+    TRANSFORMED_MASTER_DATA_ONE_ROW_PER_PERSON_PARTS,
     PERSONS_PROCESSED_ONE_ROW_PER_PERSON,
 )
 
@@ -11,50 +15,126 @@ from path_fns.filepaths import (
 from transform_master_data.full_name_alternatives_per_person import (
     add_full_name_alternatives_per_person,
 )
-from transform_master_data.pipeline import SQLPipeline
+from transform_master_data.pipeline import SQLPipeline, format_profile
 
-from transform_master_data.parse_point import parse_point_to_lat_lng
+from transform_master_data.parse_point import parse_points_to_lat_lng
+from scrape_wikidata.manifest import ProgressReporter
 
-Path(TRANSFORMED_MASTER_DATA_ONE_ROW_PER_PERSON).mkdir(parents=True, exist_ok=True)
 
-con = duckdb.connect()
-pipeline = SQLPipeline(con)
+def transform_pipeline(con, input_sql):
+    pipeline = SQLPipeline(con)
 
+    pipeline.enqueue_sql(input_sql, "df")
 
-sql = f"""
-select *
-from '{PERSONS_PROCESSED_ONE_ROW_PER_PERSON}'
-where array_length(birth_coordinates) > 0
-and  array_length(residence_coordinates) > 0
-limit 20
-"""
+    pipeline = add_full_name_alternatives_per_person(
+        pipeline, output_table_name="df_full_names", input_table_name="df"
+    )
 
-pipeline.enqueue_sql(sql, "df")
+    pipeline = parse_points_to_lat_lng(
+        pipeline,
+        ["birth_coordinates", "residence_coordinates"],
+        output_table_name="df_coordinates_fixed",
+        input_table_name="df_full_names",
+    )
+    return pipeline
 
-pipeline = add_full_name_alternatives_per_person(
-    pipeline, output_table_name="df_full_names", input_table_name="df"
-)
 
-pipeline = parse_point_to_lat_lng(
-    pipeline,
-    "birth_coordinates",
-    output_table_name="df_bc_fixed",
-    input_table_name="df_full_names",
+def print_profile(pipeline):
+    stages = pipeline.profile_pipeline()
+    print(format_profile(stages))
+    slowest = max(stages, key=lambda stage: stage.seconds)
+    print(f"\nEXPLAIN ANALYZE of the slowest stage, {slowest.output_table_name}:")
+    print(slowest.explain_analyze)
+
+
+def chunks_of_row_groups(parquet_file, chunk_rows):
+    """Split the row groups of parquet_file into runs of consecutive row
+    groups with at least chunk_rows rows between them (except the last run)
+    """
+    chunk = []
+    num_rows = 0
+    for i in range(parquet_file.num_row_groups):
+        chunk.append(i)
+        num_rows += parquet_file.metadata.row_group(i).num_rows
+        if num_rows >= chunk_rows:
+            yield chunk
+            chunk = []
+            num_rows = 0
+    if chunk:
+        yield chunk
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="Time each stage of the pipeline and print a report, rather than "
+    "writing the output.  Without --sample, the first chunk is profiled",
+)
+parser.add_argument(
+    "--sample",
+    type=int,
+    default=None,
+    help="Transform only this many people with birth and residence "
+    "coordinates, to a single file, as a quick check",
 )
-pipeline = parse_point_to_lat_lng(
-    pipeline,
-    "residence_coordinates",
-    output_table_name="df_rc_fixed",
-    input_table_name="df_bc_fixed",
+parser.add_argument(
+    "--chunk_rows",
+    type=int,
+    default=100_000,
+    help="Transform the whole table in chunks of about this many people, "
+    "so memory use is bounded",
 )
+args = parser.parse_args()
 
+Path(TRANSFORMED_MASTER_DATA_ONE_ROW_PER_PERSON).mkdir(parents=True, exist_ok=True)
 
-df = pipeline.execute_pipeline()
+con = get_connection()
 
+if args.sample is not None:
+    sql = f"""
+    select *
+    from '{PERSONS_PROCESSED_ONE_ROW_PER_PERSON}'
+    where array_length(birth_coordinates) > 0
+    and  array_length(residence_coordinates) > 0
+    limit {args.sample}
+    """
+    pipeline = transform_pipeline(con, sql)
 
-out_path = os.path.join(
-    TRANSFORMED_MASTER_DATA_ONE_ROW_PER_PERSON, "transformed_master_data.parquet"
-)
+    if args.profile:
+        print_profile(pipeline)
+    else:
+        df_arrow = pipeline.execute_pipeline()
+
+        out_path = os.path.join(
+            TRANSFORMED_MASTER_DATA_ONE_ROW_PER_PERSON,
+            "transformed_master_data.parquet",
+        )
+
+        pq.write_table(df_arrow, out_path)
+
+else:
+    # Each chunk of the input is read from disk, transformed and written out
+    # in turn, one output file per chunk, so only one chunk is ever in memory
+    parquet_file = pq.ParquetFile(PERSONS_PROCESSED_ONE_ROW_PER_PERSON)
+    chunks = list(chunks_of_row_groups(parquet_file, args.chunk_rows))
+    pipeline = transform_pipeline(con, "select * from input_chunk")
+
+    if args.profile:
+        con.register("input_chunk", parquet_file.read_row_groups(chunks[0]))
+        print_profile(pipeline)
+    else:
+        out_dir = TRANSFORMED_MASTER_DATA_ONE_ROW_PER_PERSON_PARTS
+        shutil.rmtree(out_dir, ignore_errors=True)
+        Path(out_dir).mkdir(parents=True, exist_ok=True)
+
+        progress = ProgressReporter(len(chunks))
+        for i, row_groups in enumerate(chunks):
+            con.register("input_chunk", parquet_file.read_row_groups(row_groups))
+            df_arrow = pipeline.execute_pipeline()
+            con.unregister("input_chunk")
+
+            pq.write_table(df_arrow, os.path.join(out_dir, f"part_{i:05}.parquet"))
 
-df_arrow = df.fetch_arrow_table()
-pq.write_table(df_arrow, out_path)
+            progress.update(1, df_arrow.num_rows)
+            print(f"Chunk {i + 1}: {progress.report()}")
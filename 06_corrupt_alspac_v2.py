@@ -6,12 +6,8 @@ import os
 import logging
 import pandas as pd
 import numpy as np
-import duckdb
-
-# create path and transform .csv gold to parquet
-df = pd.read_csv('ALSPAC_syn_gold.csv')
-df.to_parquet('syn_alspac_to_corrupt.parquet')
-pd.read_parquet('syn_alspac_to_corrupt.parquet', engine='pyarrow')
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 
 # This Block Introduces the corruption functions 
@@ -30,7 +26,11 @@ from corrupt.corrupt_name import (
     alspac_first_name_random, 
     alspac_G1_surname_random, 
     alspac_G0_surname_random, 
+    alspac_first_name_random_batch,
+    alspac_G1_surname_random_batch,
+    alspac_G0_surname_random_batch,
     alspac_first_name_alternatives, 
+    alspac_first_name_alternatives_batch,
     alspac_first_name_insertion,
     alspac_first_name_deletion,
     alspac_G1_last_name_insertion,
@@ -39,6 +39,8 @@ from corrupt.corrupt_name import (
     alspac_G0_last_name_deletion,
     alspac_first_name_typo, 
     alspac_name_inversion,
+    attach_alt_name_positions,
+    get_given_name_sampler,
 )
 
 from corrupt.corrupt_id import (
@@ -79,16 +81,17 @@ from corrupt.record_corruptor import (
     CompositeCorruption,
     ProbabilityAdjustmentFromSQL,
 )
+from corrupt.record_rng import record_rngs, uniforms
+from corrupt.sharded_runner import run_sharded
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(
     format="%(message)s",
+    level=logging.INFO,
 )
 logger.setLevel(logging.INFO)
 
 
-con = duckdb.connect()
-
 # change path to gold.
 
 in_path = os.path.join("syn_alspac_to_corrupt.parquet")
@@ -156,405 +159,529 @@ config = [
 ]
 
 
-rc = RecordCorruptor()
+def build_record_corruptor():
+    rc = RecordCorruptor()
 
-########
-# Date of birth
-########
-"""
-g1_dob_jan_first = CompositeCorruption(
-    name="g1_dob_jan_first", baseline_probability=0.005
-)
+    ########
+    # Date of birth
+    ########
+    """
+    g1_dob_jan_first = CompositeCorruption(
+        name="g1_dob_jan_first", baseline_probability=0.005
+    )
 
-g1_dob_jan_first.add_corruption_function(
-    date_corrupt_jan_first, args ={"input_colname": "g1_dob","output_colname": "g1_dob"}
-)
+    g1_dob_jan_first.add_corruption_function(
+        date_corrupt_jan_first, args ={"input_colname": "g1_dob","output_colname": "g1_dob"}
+    )
 
-rc.add_composite_corruption(g1_dob_jan_first)
+    rc.add_composite_corruption(g1_dob_jan_first)
 
-sql_condition = "year(try_cast(g1_dob as date)) < 1900"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_dob_jan_first, 4)
-rc.add_probability_adjustment(adjustment)
+    sql_condition = "year(try_cast(g1_dob as date)) < 1900"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_dob_jan_first, 4)
+    rc.add_probability_adjustment(adjustment)
 
-rc.add_simple_corruption(
-    name="dob_null",
-    corruption_function=null_corruption,
-    args={"output_colname": "g1_dob"},
-    baseline_probability=0.01,
-)
-"""
-########
-# Name-based corruptions
-########
-
-## First Name Errors
-firstname_random_corruption = CompositeCorruption(name="random_first", baseline_probability=0.15)
-firstname_random_corruption.add_corruption_function(alspac_first_name_random, args={})
-rc.add_composite_corruption(firstname_random_corruption)
-
-
-firstname_variant_corruption = CompositeCorruption(name="first_name_variants", baseline_probability=0.25)
-firstname_variant_corruption.add_corruption_function(alspac_first_name_alternatives, args={})
-rc.add_composite_corruption(firstname_variant_corruption)
-
-firstname_deletion_corruption = CompositeCorruption(name="first_name_deletion",baseline_probability=0.1)
-firstname_deletion_corruption.add_corruption_function(alspac_first_name_deletion, args={})
-rc.add_composite_corruption(firstname_deletion_corruption)
-
-
-firstname_insertion_corruption = CompositeCorruption(name="first_name_insertion",baseline_probability=0.1)
-firstname_insertion_corruption.add_corruption_function(alspac_first_name_insertion,args={})
-rc.add_composite_corruption(firstname_insertion_corruption)
-
-firstname_typo_corruption = CompositeCorruption(name="first_name_typo",baseline_probability=0.1)
-firstname_typo_corruption.add_corruption_function(alspac_first_name_typo,args={})
-rc.add_composite_corruption(firstname_typo_corruption)
-
-
-# Ethnicity adjustments 
-# white as reference for first name errors
-sql_condition = "ethgroup in ('Missing', 'NA','None')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 0.72)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 0.72)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 0.72)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 0.72)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 0.72)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "ethgroup in ('Black')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 1.19)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 1.19)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 1.19)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 1.19)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 1.19)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "ethgroup in ('Asian')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 0.99)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 0.99)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 0.99)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 0.99)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 0.99)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "ethgroup in ('Other')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 1.13)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 1.13)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 1.13)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 1.13)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 1.13)
-rc.add_probability_adjustment(adjustment)
-
-# Maternal age adjustments 
-# 30-39 as reference for first name errors
-sql_condition = "maternal_agecat in ('<20')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 0.57)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 0.57)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 0.57)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 0.57)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 0.57)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "maternal_agecat in ('20-29')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 0.85)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 0.85)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 0.85)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 0.85)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 0.85)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "maternal_agecat in ('40+')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 1.09)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 1.09)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 1.09)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 1.09)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 1.09)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "maternal_agecat in ('Missing', 'NA','None')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 1.24)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 1.24)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 1.24)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 1.24)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 1.24)
-rc.add_probability_adjustment(adjustment)
-
-
-## G0 Last Name Errors
-g0_lastname_deletion_corruption = CompositeCorruption(name="G0_last_name_deletion",baseline_probability=0.1)
-g0_lastname_deletion_corruption.add_corruption_function(alspac_G0_last_name_deletion,args={})
-rc.add_composite_corruption(g0_lastname_deletion_corruption)
-
-g0_lastname_insertion_corruption = CompositeCorruption(name="G0_last_name_insertion",baseline_probability=0.1)
-g0_lastname_insertion_corruption.add_corruption_function(alspac_G0_last_name_insertion,args={})
-rc.add_composite_corruption(g0_lastname_insertion_corruption)
-
-g0_lastname_random_corruption = CompositeCorruption(name="G0_last_name_random",baseline_probability=0.2)
-g0_lastname_random_corruption.add_corruption_function(alspac_G0_surname_random,args={})
-rc.add_composite_corruption(g0_lastname_random_corruption)
-
-# Ethnicity
-sql_condition = "ethgroup in ('Missing', 'NA','None')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 0.89)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 0.89)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 0.89)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "ethgroup in ('Black')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 1.05)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 1.05)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 1.05)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "ethgroup in ('Asian')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 0.46)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 0.46)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 0.46)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "ethgroup in ('Other')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 1.08)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 1.08)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 1.08)
-rc.add_probability_adjustment(adjustment)
-
-# Maternal Age Cat
-sql_condition = "maternal_agecat in ('<20')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 2.89)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 2.89)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 2.89)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "maternal_agecat in ('20-29')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 1.61)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 1.61)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 1.61)
-rc.add_probability_adjustment(adjustment)
-
-
-sql_condition = "maternal_agecat in ('40+')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 1.14)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 1.14)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 1.14)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "maternal_agecat in ('Missing', 'NA','None')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 1.50)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 1.50)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 1.50)
-rc.add_probability_adjustment(adjustment)
-
-
-#G1 Last name
-g1_lastname_deletion_corruption = CompositeCorruption(name="G1_last_name_deletion",baseline_probability=0.1)
-g1_lastname_deletion_corruption.add_corruption_function(alspac_G1_last_name_deletion,args={})
-rc.add_composite_corruption(g1_lastname_deletion_corruption)
-
-g1_lastname_insertion_corruption = CompositeCorruption(name="G1_last_name_insertion",baseline_probability=0.1)
-g1_lastname_insertion_corruption.add_corruption_function(alspac_G1_last_name_insertion,args={})
-rc.add_composite_corruption(g1_lastname_insertion_corruption)
-
-g1_lastname_random_corruption = CompositeCorruption(name="G1_last_name_random",baseline_probability=0.2)
-g1_lastname_random_corruption.add_corruption_function(alspac_G1_surname_random,args={})
-rc.add_composite_corruption(g1_lastname_random_corruption)
-
-# Ethnicity
-sql_condition = "ethgroup in ('Missing', 'NA','None')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 0.77)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 0.77)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 0.77)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "ethgroup in ('Black')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 1.43)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 1.43)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 1.43)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "ethgroup in ('Asian')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 0.34)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 0.34)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 0.34)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "ethgroup in ('Other')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 2.05)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 2.05)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 2.05)
-rc.add_probability_adjustment(adjustment)
-
-# Maternal Age Cat
-sql_condition = "maternal_agecat in ('<20')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 2.60)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 2.60)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 2.60)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "maternal_agecat in ('20-29')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 1.43)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 1.43)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 1.43)
-rc.add_probability_adjustment(adjustment)
-
-
-sql_condition = "maternal_agecat in ('40+')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 1.44)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 1.44)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 1.44)
-rc.add_probability_adjustment(adjustment)
-
-sql_condition = "maternal_agecat in ('Missing', 'NA','None')"
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 2.13)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 2.13)
-rc.add_probability_adjustment(adjustment)
-adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 2.13)
-rc.add_probability_adjustment(adjustment)
-
-name_inversion_corruption = CompositeCorruption(
-    name = "alspac_name_inversion", baseline_probability= 0.05
-)
-name_inversion_corruption.add_corruption_function(alspac_name_inversion, args={})
-rc.add_composite_corruption(name_inversion_corruption)
-
-adjustment_lookup_eth = {
-    "ethgroup":{
-        "White":[(name_inversion_corruption, 1)],
-        "Black":[(name_inversion_corruption, 1.19)],
-        "Other":[(name_inversion_corruption, 1.13)],
-        "Asian":[(name_inversion_corruption, 0.99)],
-    }
-}
+    rc.add_simple_corruption(
+        name="dob_null",
+        corruption_function=null_corruption,
+        args={"output_colname": "g1_dob"},
+        baseline_probability=0.01,
+    )
+    """
+    ########
+    # Name-based corruptions
+    ########
+
+    ## First Name Errors
+    firstname_random_corruption = CompositeCorruption(name="random_first", baseline_probability=0.15)
+    firstname_random_corruption.add_corruption_function(
+        alspac_first_name_random, args={}, batch_fn=alspac_first_name_random_batch
+    )
+    rc.add_composite_corruption(firstname_random_corruption)
 
-adjustment_eth = ProbabilityAdjustmentFromLookup(adjustment_lookup_eth)
-rc.add_probability_adjustment(adjustment_eth)
 
-adjustment_lookup_mat = {
-    "maternal_agecat":{
-        "<20":[(name_inversion_corruption, 2.60)],
-        "20-29":[(name_inversion_corruption, 1.43)],
-        "30-39":[(name_inversion_corruption, 1)],
-        "40+":[(name_inversion_corruption, 1.44)],
-        "NA":[(name_inversion_corruption, 2.13)],
+    firstname_variant_corruption = CompositeCorruption(name="first_name_variants", baseline_probability=0.25)
+    firstname_variant_corruption.add_corruption_function(
+        alspac_first_name_alternatives,
+        args={},
+        batch_fn=alspac_first_name_alternatives_batch,
+    )
+    rc.add_composite_corruption(firstname_variant_corruption)
+
+    firstname_deletion_corruption = CompositeCorruption(name="first_name_deletion",baseline_probability=0.1)
+    firstname_deletion_corruption.add_corruption_function(alspac_first_name_deletion, args={})
+    rc.add_composite_corruption(firstname_deletion_corruption)
+
+
+    firstname_insertion_corruption = CompositeCorruption(name="first_name_insertion",baseline_probability=0.1)
+    firstname_insertion_corruption.add_corruption_function(alspac_first_name_insertion,args={})
+    rc.add_composite_corruption(firstname_insertion_corruption)
+
+    firstname_typo_corruption = CompositeCorruption(name="first_name_typo",baseline_probability=0.1)
+    firstname_typo_corruption.add_corruption_function(alspac_first_name_typo,args={})
+    rc.add_composite_corruption(firstname_typo_corruption)
+
+
+    # Ethnicity adjustments 
+    # white as reference for first name errors
+    sql_condition = "ethgroup in ('Missing', 'NA','None')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 0.72)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 0.72)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 0.72)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 0.72)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 0.72)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "ethgroup in ('Black')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 1.19)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 1.19)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 1.19)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 1.19)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 1.19)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "ethgroup in ('Asian')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 0.99)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 0.99)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 0.99)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 0.99)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 0.99)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "ethgroup in ('Other')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 1.13)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 1.13)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 1.13)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 1.13)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 1.13)
+    rc.add_probability_adjustment(adjustment)
+
+    # Maternal age adjustments 
+    # 30-39 as reference for first name errors
+    sql_condition = "maternal_agecat in ('<20')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 0.57)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 0.57)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 0.57)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 0.57)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 0.57)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "maternal_agecat in ('20-29')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 0.85)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 0.85)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 0.85)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 0.85)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 0.85)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "maternal_agecat in ('40+')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 1.09)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 1.09)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 1.09)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 1.09)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 1.09)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "maternal_agecat in ('Missing', 'NA','None')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_random_corruption, 1.24)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_variant_corruption, 1.24)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_deletion_corruption, 1.24)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_insertion_corruption, 1.24)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, firstname_typo_corruption, 1.24)
+    rc.add_probability_adjustment(adjustment)
+
+
+    ## G0 Last Name Errors
+    g0_lastname_deletion_corruption = CompositeCorruption(name="G0_last_name_deletion",baseline_probability=0.1)
+    g0_lastname_deletion_corruption.add_corruption_function(alspac_G0_last_name_deletion,args={})
+    rc.add_composite_corruption(g0_lastname_deletion_corruption)
+
+    g0_lastname_insertion_corruption = CompositeCorruption(name="G0_last_name_insertion",baseline_probability=0.1)
+    g0_lastname_insertion_corruption.add_corruption_function(alspac_G0_last_name_insertion,args={})
+    rc.add_composite_corruption(g0_lastname_insertion_corruption)
+
+    g0_lastname_random_corruption = CompositeCorruption(name="G0_last_name_random",baseline_probability=0.2)
+    g0_lastname_random_corruption.add_corruption_function(
+        alspac_G0_surname_random, args={}, batch_fn=alspac_G0_surname_random_batch
+    )
+    rc.add_composite_corruption(g0_lastname_random_corruption)
+
+    # Ethnicity
+    sql_condition = "ethgroup in ('Missing', 'NA','None')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 0.89)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 0.89)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 0.89)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "ethgroup in ('Black')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 1.05)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 1.05)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 1.05)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "ethgroup in ('Asian')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 0.46)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 0.46)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 0.46)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "ethgroup in ('Other')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 1.08)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 1.08)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 1.08)
+    rc.add_probability_adjustment(adjustment)
+
+    # Maternal Age Cat
+    sql_condition = "maternal_agecat in ('<20')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 2.89)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 2.89)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 2.89)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "maternal_agecat in ('20-29')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 1.61)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 1.61)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 1.61)
+    rc.add_probability_adjustment(adjustment)
+
+
+    sql_condition = "maternal_agecat in ('40+')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 1.14)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 1.14)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 1.14)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "maternal_agecat in ('Missing', 'NA','None')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_deletion_corruption, 1.50)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_insertion_corruption, 1.50)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g0_lastname_random_corruption, 1.50)
+    rc.add_probability_adjustment(adjustment)
+
+
+    #G1 Last name
+    g1_lastname_deletion_corruption = CompositeCorruption(name="G1_last_name_deletion",baseline_probability=0.1)
+    g1_lastname_deletion_corruption.add_corruption_function(alspac_G1_last_name_deletion,args={})
+    rc.add_composite_corruption(g1_lastname_deletion_corruption)
+
+    g1_lastname_insertion_corruption = CompositeCorruption(name="G1_last_name_insertion",baseline_probability=0.1)
+    g1_lastname_insertion_corruption.add_corruption_function(alspac_G1_last_name_insertion,args={})
+    rc.add_composite_corruption(g1_lastname_insertion_corruption)
+
+    g1_lastname_random_corruption = CompositeCorruption(name="G1_last_name_random",baseline_probability=0.2)
+    g1_lastname_random_corruption.add_corruption_function(
+        alspac_G1_surname_random, args={}, batch_fn=alspac_G1_surname_random_batch
+    )
+    rc.add_composite_corruption(g1_lastname_random_corruption)
+
+    # Ethnicity
+    sql_condition = "ethgroup in ('Missing', 'NA','None')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 0.77)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 0.77)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 0.77)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "ethgroup in ('Black')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 1.43)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 1.43)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 1.43)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "ethgroup in ('Asian')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 0.34)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 0.34)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 0.34)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "ethgroup in ('Other')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 2.05)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 2.05)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 2.05)
+    rc.add_probability_adjustment(adjustment)
+
+    # Maternal Age Cat
+    sql_condition = "maternal_agecat in ('<20')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 2.60)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 2.60)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 2.60)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "maternal_agecat in ('20-29')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 1.43)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 1.43)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 1.43)
+    rc.add_probability_adjustment(adjustment)
+
+
+    sql_condition = "maternal_agecat in ('40+')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 1.44)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 1.44)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 1.44)
+    rc.add_probability_adjustment(adjustment)
+
+    sql_condition = "maternal_agecat in ('Missing', 'NA','None')"
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_deletion_corruption, 2.13)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_insertion_corruption, 2.13)
+    rc.add_probability_adjustment(adjustment)
+    adjustment = ProbabilityAdjustmentFromSQL(sql_condition, g1_lastname_random_corruption, 2.13)
+    rc.add_probability_adjustment(adjustment)
+
+    name_inversion_corruption = CompositeCorruption(
+        name = "alspac_name_inversion", baseline_probability= 0.05
+    )
+    name_inversion_corruption.add_corruption_function(alspac_name_inversion, args={})
+    rc.add_composite_corruption(name_inversion_corruption)
+
+    adjustment_lookup_eth = {
+        "ethgroup":{
+            "White":[(name_inversion_corruption, 1)],
+            "Black":[(name_inversion_corruption, 1.19)],
+            "Other":[(name_inversion_corruption, 1.13)],
+            "Asian":[(name_inversion_corruption, 0.99)],
+        }
     }
-}
 
-adjustment_mat = ProbabilityAdjustmentFromLookup(adjustment_lookup_mat)
-rc.add_probability_adjustment(adjustment_mat)
-                   
-max_corrupted_records = 20
-zipf_dist = get_zipf_dist(max_corrupted_records)
+    adjustment_eth = ProbabilityAdjustmentFromLookup(adjustment_lookup_eth)
+    rc.add_probability_adjustment(adjustment_eth)
+
+    adjustment_lookup_mat = {
+        "maternal_agecat":{
+            "<20":[(name_inversion_corruption, 2.60)],
+            "20-29":[(name_inversion_corruption, 1.43)],
+            "30-39":[(name_inversion_corruption, 1)],
+            "40+":[(name_inversion_corruption, 1.44)],
+            "NA":[(name_inversion_corruption, 2.13)],
+        }
+    }
 
+    adjustment_mat = ProbabilityAdjustmentFromLookup(adjustment_lookup_mat)
+    rc.add_probability_adjustment(adjustment_mat)
 
-pd.options.display.max_columns = 1000
-pd.options.display.max_colwidth = 1000
+    return rc
 
-Path(ALSPAC_corrupt_outpath).mkdir(parents=True, exist_ok=True)
 
-out_path = os.path.join(ALSPAC_corrupt_outpath)
+max_corrupted_records = 20
+zipf_dist = get_zipf_dist(max_corrupted_records)
+zipf_cumulative_weights = np.cumsum(zipf_dist["weights"])
 
-sql = f"""
-select *
-from '{in_path}'
-"""
 
-raw_data = con.execute(sql).df()
-records = raw_data.to_dict(orient="records")
+# Output columns whose type may differ from the input column they're created from,
+# e.g. because corruptions replace them with strings
+OUTPUT_COLUMN_TYPES = {
+    "gender": pa.string(),
+    "g1_dob": pa.string(),
+    "G0_surname": pa.string(),
+    "G1_surname": pa.string(),
+    "G1_firstname": pa.string(),
+}
 
-output_records = []
-for i, master_input_record in enumerate(records):
+
+def get_output_schema(input_schema):
+    """The fixed schema of the output records.  Columns take the type of the
+    input column they're copied from, unless set in OUTPUT_COLUMN_TYPES
+    """
+    id_type = input_schema.field("random_id").type
+    fields = [
+        pa.field("uncorrupted_record", pa.bool_()),
+        pa.field("cluster", id_type),
+    ]
+    for c in config:
+        col_name = c["col_name"]
+        if col_name in OUTPUT_COLUMN_TYPES:
+            fields.append(pa.field(col_name, OUTPUT_COLUMN_TYPES[col_name]))
+        else:
+            fields.append(input_schema.field(col_name))
+    fields.append(pa.field("id", id_type))
+    fields.append(pa.field("corruptions_applied", pa.list_(pa.string())))
+    return pa.schema(fields)
+
+
+def num_corrupted_records_to_generate(rng):
+    """Draw how many corrupted records to generate for each master record from
+    the zipf distribution, one draw from each of rng, a list of Generators
+    """
+    draws = uniforms(rng, len(rng))
+    choices = np.searchsorted(zipf_cumulative_weights, draws, side="right")
+    choices = np.minimum(choices, len(zipf_cumulative_weights) - 1)
+    return np.asarray(zipf_dist["vals"])[choices]
+
+
+def corrupt_records(raw_data, rc, seed):
+    """Create the uncorrupted and corrupted output records for a dataframe of
+    master records.
+
+    Every random draw for an output record comes from its own stream, keyed
+    by seed, the random_id of its master record, and its index among the
+    records generated from that master record, so the output for each master
+    record is the same however the master records are split into shards and
+    chunks
+    """
+    records = raw_data.to_dict(orient="records")
 
     # Formats the input data into an easy format for producing
     # an uncorrupted/corrupted outputs records
-    formatted_master_record = format_master_data(master_input_record, config)
+    formatted_master_records = [format_master_data(r, config) for r in records]
+
+    uncorrupted_output_records = []
+    for formatted_master_record in formatted_master_records:
+        uncorrupted_output_record = alspac_generate_uncorrupted_output_record(
+            formatted_master_record, config
+        )
+        uncorrupted_output_record["corruptions_applied"] = []
+        uncorrupted_output_records.append(uncorrupted_output_record)
+
+    # How many corrupted records to generate for each master record, drawn from
+    # the stream of the master record itself
+    record_ids = raw_data["random_id"].to_numpy()
+    num_corrupted_records = num_corrupted_records_to_generate(
+        record_rngs(seed, record_ids)
+    )
+    master_index = np.repeat(np.arange(len(records)), num_corrupted_records)
 
-    uncorrupted_output_record = alspac_generate_uncorrupted_output_record(
-        formatted_master_record, config
+    # The corrupted records of each master record are numbered from 1
+    first_of_master = np.repeat(
+        np.cumsum(num_corrupted_records) - num_corrupted_records,
+        num_corrupted_records,
     )
-    uncorrupted_output_record["corruptions_applied"] = []
+    duplicate_index = np.arange(len(master_index)) - first_of_master + 1
+    corrupted_rngs = record_rngs(seed, record_ids[master_index], duplicate_index)
 
-    output_records.append(uncorrupted_output_record)
+    uncorrupted_df = pd.DataFrame(uncorrupted_output_records)
 
-    # How many corrupted records to generate
-    total_num_corrupted_records = np.random.choice(
-        zipf_dist["vals"], p=zipf_dist["weights"]
+    # Probability each composite corruption is activated, for each master record
+    activation_probabilities = rc.activation_probabilities(uncorrupted_df)
+
+    records_to_modify = uncorrupted_df.iloc[master_index]
+    records_to_modify = records_to_modify.assign(uncorrupted_record=False)
+
+    # Each composite corruption is applied to all the records it activates for
+    # at once
+    corrupted_df = rc.apply_corruptions_to_batch(
+        pd.DataFrame(formatted_master_records).iloc[master_index],
+        records_to_modify,
+        activation_probabilities[master_index],
+        rng=corrupted_rngs,
     )
 
-    for k in range(total_num_corrupted_records):
-        record_to_modify = uncorrupted_output_record.copy()
-        record_to_modify["corruptions_applied"] = []
-        record_to_modify["uncorrupted_record"] = False
-        rc.apply_probability_adjustments(uncorrupted_output_record)
-        corrupted_record = rc.apply_corruptions_to_record(
-            formatted_master_record,
-            record_to_modify,
-        )
-        output_records.append(corrupted_record)
-        print("write record number " + str(k) + "for id number " + str(i))
+    # Output each uncorrupted record followed by its corrupted records
+    uncorrupted_df["master_index"] = np.arange(len(records))
+    corrupted_df["master_index"] = master_index
+    df = pd.concat([uncorrupted_df, corrupted_df], ignore_index=True)
+    df = df.sort_values("master_index", kind="stable")
+    return df.drop(columns="master_index")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes",
+    )
+    parser.add_argument(
+        "--num_shards",
+        type=int,
+        default=None,
+        help="Number of shards to split the input into. Defaults to 4 per worker",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed for the random streams. The output is reproducible for a "
+        "given seed, whatever the number of shards and workers",
+    )
+    args = parser.parse_args()
+
+    # create path and transform .csv gold to parquet
+    df = pd.read_csv("ALSPAC_syn_gold.csv")
+    df.to_parquet(in_path)
 
-df = pd.DataFrame(output_records)
+    # Join the position of each first name in the alternative names lookup onto
+    # the master records once, so the workers draw alternatives by array
+    # indexing, rather than looking up each name
+    master_records = attach_alt_name_positions(
+        pq.read_table(in_path), "G1_firstname", get_given_name_sampler()
+    )
+    pq.write_table(master_records, in_path)
+
+    pd.options.display.max_columns = 1000
+    pd.options.display.max_colwidth = 1000
+
+    Path(ALSPAC_corrupt_outpath).mkdir(parents=True, exist_ok=True)
+
+    out_paths = run_sharded(
+        in_path,
+        ALSPAC_corrupt_outpath,
+        build_record_corruptor,
+        corrupt_records,
+        num_shards=args.num_shards,
+        num_workers=args.num_workers,
+        seed=args.seed,
+        output_schema=get_output_schema(pq.read_schema(in_path)),
+    )
 
-df.to_parquet(out_path, index=False)
-print(f"written with {len(df):,.0f} records")
+    num_records = sum(pq.ParquetFile(p).metadata.num_rows for p in out_paths)
+    print(f"written with {num_records:,.0f} records to {len(out_paths)} files")
@@ -0,0 +1,161 @@
+import os
+import shutil
+import time
+
+import numpy as np
+import pyarrow as pa
+
+# A compact on-disk format for the alternative name lookups created by
+# 04_create_name_lookups.py.  Each lookup is a directory of .npy files, which
+# are memory mapped when read, so loading a lookup takes milliseconds and the
+# pages are shared between all the processes that read it.
+#
+# Strings are stored arrow-style, as int64 offsets into a buffer of utf-8
+# bytes, so they can be wrapped as an arrow array without copying.  The
+# alternatives of the i-th original name are at positions
+# alt_offsets[i]:alt_offsets[i+1] of the alt name arrays.
+#
+# The lookup directory is a symlink to a hidden sibling directory holding one
+# version of the arrays.  A new version is written in full before the symlink
+# is atomically replaced, and readers resolve the symlink once, so they see
+# either all the old arrays or all the new ones, never a mix.
+
+COMPACT_ARRAY_NAMES = [
+    "original_name_offsets",
+    "original_name_bytes",
+    "alt_offsets",
+    "alt_name_offsets",
+    "alt_name_bytes",
+    "alt_name_weights",
+    "alias_prob",
+    "alias_index",
+]
+
+
+def build_alias_tables(offsets, weights):
+    """Build a Walker/Vose alias table for each group of weights, where the
+    weights of group i are weights[offsets[i]:offsets[i+1]].
+
+    Returns flat arrays (alias_prob, alias_index) aligned to weights.  To draw
+    from group i, pick a slot in the group uniformly at random, and keep it
+    with probability alias_prob[slot], otherwise use alias_index[slot]
+    """
+    alias_prob = np.ones(len(weights))
+    alias_index = np.arange(len(weights))
+
+    for start, stop in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+        num_alts = stop - start
+        total_weight = weights[start:stop].sum()
+        if num_alts == 0 or total_weight <= 0:
+            continue
+
+        scaled = (weights[start:stop] * num_alts / total_weight).tolist()
+        small = [i for i, s in enumerate(scaled) if s < 1]
+        large = [i for i, s in enumerate(scaled) if s >= 1]
+
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            alias_prob[start + s] = scaled[s]
+            alias_index[start + s] = start + l
+            scaled[l] = scaled[l] + scaled[s] - 1
+            if scaled[l] < 1:
+                small.append(l)
+            else:
+                large.append(l)
+
+    return alias_prob, alias_index
+
+
+def strings_to_buffers(strings):
+    """Encode strings as (offsets, bytes) numpy arrays.  Nulls become ''"""
+    encoded = [("" if s is None else s).encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return offsets, data
+
+
+def strings_from_buffers(offsets, data):
+    """Wrap (offsets, bytes) arrays as an arrow large_string array, without
+    copying them
+    """
+    return pa.LargeStringArray.from_buffers(
+        len(offsets) - 1, pa.py_buffer(offsets), pa.py_buffer(data)
+    )
+
+
+def write_compact_name_lookup(table, out_dir):
+    """table is an arrow table with columns original_name, alt_name_arr and
+    alt_name_weight_arr, as created by 04_create_name_lookups.py
+    """
+    alt_name_arr = table.column("alt_name_arr").combine_chunks()
+    weight_arr = table.column("alt_name_weight_arr").combine_chunks()
+
+    alt_offsets = alt_name_arr.offsets.to_numpy().astype(np.int64)
+    alt_offsets = alt_offsets - alt_offsets[0]
+    weights = weight_arr.flatten().to_numpy(zero_copy_only=False)
+    weights = np.asarray(weights, dtype=np.float64)
+    alias_prob, alias_index = build_alias_tables(alt_offsets, weights)
+
+    original_name_offsets, original_name_bytes = strings_to_buffers(
+        table.column("original_name").to_pylist()
+    )
+    alt_name_offsets, alt_name_bytes = strings_to_buffers(
+        alt_name_arr.flatten().to_pylist()
+    )
+
+    arrays = {
+        "original_name_offsets": original_name_offsets,
+        "original_name_bytes": original_name_bytes,
+        "alt_offsets": alt_offsets,
+        "alt_name_offsets": alt_name_offsets,
+        "alt_name_bytes": alt_name_bytes,
+        "alt_name_weights": weights,
+        "alias_prob": alias_prob,
+        "alias_index": alias_index.astype(np.int64),
+    }
+
+    out_dir = os.path.normpath(out_dir)
+    parent, dir_name = os.path.split(out_dir)
+    os.makedirs(parent or ".", exist_ok=True)
+
+    version_dir = os.path.join(parent, f".{dir_name}.{time.time_ns()}")
+    os.mkdir(version_dir)
+    for name in COMPACT_ARRAY_NAMES:
+        np.save(os.path.join(version_dir, f"{name}.npy"), arrays[name])
+
+    previous_version_dir = None
+    if os.path.islink(out_dir):
+        previous_version_dir = os.path.realpath(out_dir)
+    elif os.path.isdir(out_dir):
+        # A lookup written before lookups were versioned
+        shutil.rmtree(out_dir)
+
+    tmp_link = os.path.join(parent, f".{dir_name}.link-{os.getpid()}")
+    os.symlink(os.path.basename(version_dir), tmp_link)
+    os.replace(tmp_link, out_dir)
+
+    # Processes which have already memory mapped the previous version keep
+    # their mappings after it's deleted
+    if previous_version_dir is not None:
+        shutil.rmtree(previous_version_dir, ignore_errors=True)
+
+
+def compact_name_lookup_exists(in_dir):
+    return all(
+        os.path.exists(os.path.join(in_dir, f"{name}.npy"))
+        for name in COMPACT_ARRAY_NAMES
+    )
+
+
+def read_compact_name_lookup(in_dir):
+    """Memory map the arrays of a compact name lookup, returning a dict of
+    array name -> read only numpy array
+    """
+    # Resolve the symlink once, so all the arrays come from the same version
+    in_dir = os.path.realpath(in_dir)
+    return {
+        name: np.load(os.path.join(in_dir, f"{name}.npy"), mmap_mode="r")
+        for name in COMPACT_ARRAY_NAMES
+    }
@@ -1,4 +1,3 @@
-import random
 import numpy as np
 from datetime import timedelta
 from datetime import datetime
@@ -7,6 +6,7 @@ from corrupt.geco_corrupt import (
     CorruptValueNumpad,
     position_mod_uniform,
 )
+from corrupt.record_rng import get_rng
 
 
 def date_gen_uncorrupted_record(
@@ -17,7 +17,11 @@ def date_gen_uncorrupted_record(
 
 
 def date_corrupt_typo(
-    formatted_master_record, input_colname, output_colname, record_to_modify={}
+    formatted_master_record,
+    input_colname,
+    output_colname,
+    record_to_modify={},
+    rng=None,
 ):
 
     if not formatted_master_record[input_colname]:
@@ -30,7 +34,7 @@ def date_corrupt_typo(
     )
 
     dob_ex_year = input_value_as_str[2:]
-    corrupted_dob_ex_year = numpad_corruptor.corrupt_value(dob_ex_year)
+    corrupted_dob_ex_year = numpad_corruptor.corrupt_value(dob_ex_year, rng=rng)
     record_to_modify[output_colname] = input_value_as_str[:2] + corrupted_dob_ex_year
 
     return record_to_modify
@@ -42,6 +46,7 @@ def date_corrupt_timedelta(
     input_colname,
     output_colname,
     num_days_delta,
+    rng=None,
 ):
 
     if not record_to_modify[input_colname]:
@@ -53,7 +58,8 @@ def date_corrupt_timedelta(
     except ValueError:
         return record_to_modify
 
-    delta = timedelta(days=random.randint(-num_days_delta, num_days_delta))
+    rng = get_rng(rng)
+    delta = timedelta(days=int(rng.integers(-num_days_delta, num_days_delta + 1)))
 
     input_value = input_value + delta
     record_to_modify[output_colname] = str(input_value.date())
@@ -62,7 +68,7 @@ def date_corrupt_timedelta(
 
 
 def date_corrupt_jan_first(
-    formatted_master_record, record_to_modify, input_colname, output_colname
+    formatted_master_record, record_to_modify, input_colname, output_colname, rng=None
 ):
 
     if not record_to_modify[input_colname]:
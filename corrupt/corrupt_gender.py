@@ -3,7 +3,7 @@ def gen_uncorrupted_gender(formatted_master_record, record_to_modify={}):
     return record_to_modify
 
 
-def gender_corrupt(formatted_master_record, record_to_modify={}):
+def gender_corrupt(formatted_master_record, record_to_modify={}, rng=None):
     """Replace Male = Female, Female = Male"""
     
     options = formatted_master_record["gender"]
@@ -1,14 +1,15 @@
 import math
-import random
-from numpy.random import chisquare
 
+from corrupt.record_rng import get_rng
 
-def offset_by_distance_in_random_direction(geo_struct, distance_km):
+
+def offset_by_distance_in_random_direction(geo_struct, distance_km, rng=None):
 
     lat = geo_struct["lat"]
     lng = geo_struct["lng"]
 
-    radians = random.uniform(0, 2 * math.pi)
+    rng = get_rng(rng)
+    radians = rng.uniform(0, 2 * math.pi)
 
     dx = math.sin(radians) * distance_km
     dy = math.cos(radians) * distance_km
@@ -28,6 +29,7 @@ def lat_lng_corrupt_distance(
     distance_min=10,
     distance_max=10,
     record_to_modify={},
+    rng=None,
 ):
 
     if not formatted_master_record[input_colname]:
@@ -35,11 +37,14 @@ def lat_lng_corrupt_distance(
         return record_to_modify
     else:
         geostruct = formatted_master_record[input_colname][0]
+        rng = get_rng(rng)
         # Chisquare 3 runs between 0 and about 10
-        chi = chisquare(3, 1)
+        chi = rng.chisquare(3, 1)
         multiplier = (distance_max - distance_min) / 10
         distance = (chi * multiplier) + distance_min
-        new_geostruct = offset_by_distance_in_random_direction(geostruct, distance)
+        new_geostruct = offset_by_distance_in_random_direction(
+            geostruct, distance, rng=rng
+        )
         record_to_modify[output_colname] = new_geostruct
     return record_to_modify
 
@@ -1,9 +1,24 @@
 import numpy as np
 import functools
-import random
 import pandas as pd
-
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from corrupt.compact_name_lookup import (
+    build_alias_tables,
+    compact_name_lookup_exists,
+    read_compact_name_lookup,
+    strings_from_buffers,
+)
 from corrupt.geco_corrupt import CorruptValueQuerty, position_mod_uniform
+from corrupt.record_rng import get_rng, select_rngs, uniforms
+from path_fns.duckdb_connection import get_connection
+from path_fns.filepaths import (
+    NAMES_PROCESSED_GIVEN_NAME_ALT_LOOKUP,
+    NAMES_PROCESSED_FAMILY_NAME_ALT_LOOKUP,
+    NAMES_PROCESSED_GIVEN_NAME_ALT_LOOKUP_COMPACT,
+    NAMES_PROCESSED_FAMILY_NAME_ALT_LOOKUP_COMPACT,
+)
 
 
 @functools.lru_cache(maxsize=None)
@@ -20,6 +35,261 @@ def get_family_name_alternatives_lookup():
     return df.to_dict(orient="index")
 
 
+class NameIndex:
+    """Holds a vocabulary of names in a numpy array, so that random names can be
+    drawn without building a list of every name for each draw
+    """
+
+    def __init__(self, names):
+        self.names = np.asarray(names, dtype=object)
+
+    def _random_positions(self, size, rng):
+        return (uniforms(rng, size) * len(self.names)).astype(int)
+
+    def random_names(self, size=None, exclude=None, rng=None):
+        """Draw names uniformly at random.
+
+        If size is None, a single name is returned, otherwise an array of size
+        names.  exclude is a name, or an array of names aligned to the draws,
+        that must not be drawn e.g. the original name being corrupted.
+
+        rng is a numpy Generator, or a list of Generators, one per draw.  If
+        None, a new unseeded Generator is used
+        """
+        rng = get_rng(rng)
+
+        num_draws = 1 if size is None else size
+        names = self.names[self._random_positions(num_draws, rng)]
+
+        if exclude is not None and len(self.names) > 1:
+            exclude = np.asarray(exclude, dtype=object)
+            exclude = np.broadcast_to(exclude, names.shape)
+            clashes = names == exclude
+            while clashes.any():
+                redraws = self._random_positions(
+                    clashes.sum(), select_rngs(rng, clashes)
+                )
+                names[clashes] = self.names[redraws]
+                clashes = names == exclude
+
+        if size is None:
+            return names[0]
+        return names
+
+
+class AltNameSampler:
+    """Draws weighted alternatives for names e.g. 'joe' as an alternative to
+    'joseph', with probability given by the alternative name weights.
+
+    The alternatives of all names are stored in flat arrays, with the
+    alternatives of the i-th original name at alt_names[offsets[i]:offsets[i+1]].
+    An alias table for each original name is precomputed, so each draw takes
+    constant time, and many names can be drawn in a single vectorised call.
+
+    alt_names is an arrow string array, so that it can be memory mapped from
+    the compact lookup format without decoding every name.
+
+    Names can be looked up by name, or by their position i, which can be
+    joined onto the records in advance with attach_alt_name_positions
+    """
+
+    def __init__(self, original_names, offsets, alt_names, alias_prob, alias_index):
+        self.original_names = original_names
+        self.offsets = offsets
+        self.alt_names = alt_names
+        self.alias_prob = alias_prob
+        self.alias_index = alias_index
+        self._positions = None
+
+    @property
+    def positions(self):
+        # Only built if names are looked up by name
+        if self._positions is None:
+            self._positions = {name: i for i, name in enumerate(self.original_names)}
+        return self._positions
+
+    @classmethod
+    def from_lookup_table(cls, table):
+        """table is an arrow table with columns original_name, alt_name_arr and
+        alt_name_weight_arr, as created by 04_create_name_lookups.py
+        """
+        alt_name_arr = table.column("alt_name_arr").combine_chunks()
+        weight_arr = table.column("alt_name_weight_arr").combine_chunks()
+
+        offsets = alt_name_arr.offsets.to_numpy()
+        offsets = offsets - offsets[0]
+        alt_names = alt_name_arr.flatten()
+        weights = weight_arr.flatten().to_numpy(zero_copy_only=False)
+
+        alias_prob, alias_index = build_alias_tables(offsets, weights)
+        original_names = table.column("original_name").to_numpy()
+
+        return cls(original_names, offsets, alt_names, alias_prob, alias_index)
+
+    @classmethod
+    def from_compact(cls, in_dir):
+        """Memory map a lookup written by write_compact_name_lookup.  Only the
+        original names are decoded, the other arrays are used in place
+        """
+        arrays = read_compact_name_lookup(in_dir)
+        original_names = strings_from_buffers(
+            arrays["original_name_offsets"], arrays["original_name_bytes"]
+        ).to_numpy(zero_copy_only=False)
+        alt_names = strings_from_buffers(
+            arrays["alt_name_offsets"], arrays["alt_name_bytes"]
+        )
+        return cls(
+            original_names,
+            arrays["alt_offsets"],
+            alt_names,
+            arrays["alias_prob"],
+            arrays["alias_index"],
+        )
+
+    def __contains__(self, original_name):
+        return original_name in self.positions
+
+    def sample(self, original_names, rng=None):
+        """Draw one alternative for each name in original_names.
+
+        Returns an array aligned to original_names, which is None where a
+        name has no alternatives.  rng is a numpy Generator, or a list of
+        Generators, one per name.  If None, a new unseeded Generator is used
+        """
+        positions = np.array(
+            [self.positions.get(n, -1) for n in original_names], dtype=np.int64
+        )
+        return self.sample_positions(positions, rng=rng)
+
+    def sample_positions(self, positions, rng=None):
+        """Draw one alternative for each of the original names at positions,
+        by array indexing alone.  Returns an array aligned to positions, which
+        is None where the position is -1, or the name has no alternatives.
+        rng is as for sample
+        """
+        rng = get_rng(rng)
+
+        positions = np.asarray(positions, dtype=np.int64)
+        found = positions >= 0
+        positions = np.where(found, positions, 0)
+
+        starts = self.offsets[positions]
+        num_alts = np.where(found, self.offsets[positions + 1] - starts, 0)
+        found = num_alts > 0
+
+        alt_names = np.full(len(positions), None, dtype=object)
+        if not found.any():
+            return alt_names
+
+        # A single uniform draw picks both the slot and whether to use its alias
+        u = uniforms(rng, len(positions)) * num_alts
+        slots = np.where(found, starts + u.astype(np.int64), 0)
+        keep_slot = (u - np.floor(u)) < self.alias_prob[slots]
+        chosen = np.where(keep_slot, slots, self.alias_index[slots])
+
+        alt_names[found] = self.alt_names.take(pa.array(chosen[found])).to_numpy(
+            zero_copy_only=False
+        )
+        return alt_names
+
+    def sample_one(self, original_name, rng=None):
+        return self.sample([original_name], rng=rng)[0]
+
+
+def attach_alt_name_positions(records, colname, sampler, con=None):
+    """Join the position of each record's colname in the lookup of sampler onto
+    records, an arrow table, as the column {colname}_alt_position, which is -1
+    where the name has no alternatives.
+
+    This is done once for the whole master table in DuckDB, so that drawing
+    alternatives for a batch of records is pure array indexing
+    """
+    if con is None:
+        con = get_connection().cursor()
+
+    # DuckDB may change the types of the columns e.g. large_string to string
+    schema = records.schema.append(pa.field(f"{colname}_alt_position", pa.int64()))
+
+    positions = pa.table(
+        {
+            "original_name": pa.array(sampler.original_names, pa.string()),
+            "alt_position": pa.array(
+                np.arange(len(sampler.original_names)), pa.int64()
+            ),
+        }
+    )
+
+    # Row order isn't guaranteed to be preserved by a join, so carry an
+    # explicit index through the query
+    records = records.append_column(
+        "__record_index", pa.array(np.arange(records.num_rows))
+    )
+    con.register("records_to_prepare", records)
+    con.register("alt_name_positions", positions)
+
+    sql = f"""
+    select
+        r.* exclude (__record_index),
+        coalesce(p.alt_position, -1) as {colname}_alt_position
+    from records_to_prepare as r
+    left join alt_name_positions as p
+    on r.{colname} = p.original_name
+    order by r.__record_index
+    """
+    prepared = con.execute(sql).fetch_arrow_table()
+
+    con.unregister("records_to_prepare")
+    con.unregister("alt_name_positions")
+    return prepared.cast(schema)
+
+
+def _load_name_sampler(compact_dir, parquet_path):
+    # Prefer the memory mapped compact lookup, falling back to the parquet
+    # lookup if 04_create_name_lookups.py hasn't written it
+    if compact_name_lookup_exists(compact_dir):
+        return AltNameSampler.from_compact(compact_dir)
+    return AltNameSampler.from_lookup_table(pq.read_table(parquet_path))
+
+
+@functools.lru_cache(maxsize=None)
+def get_given_name_sampler():
+    return _load_name_sampler(
+        NAMES_PROCESSED_GIVEN_NAME_ALT_LOOKUP_COMPACT,
+        NAMES_PROCESSED_GIVEN_NAME_ALT_LOOKUP,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_family_name_sampler():
+    return _load_name_sampler(
+        NAMES_PROCESSED_FAMILY_NAME_ALT_LOOKUP_COMPACT,
+        NAMES_PROCESSED_FAMILY_NAME_ALT_LOOKUP,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_given_name_index():
+    return NameIndex(get_given_name_sampler().original_names)
+
+
+@functools.lru_cache(maxsize=None)
+def get_family_name_index():
+    return NameIndex(get_family_name_sampler().original_names)
+
+
+def _random_name_batch(
+    formatted_master_batch, batch_to_modify, colname, name_index, rng=None
+):
+    orig_names = formatted_master_batch[colname].to_numpy(dtype=object)
+    new_names = name_index.random_names(
+        size=len(orig_names), exclude=orig_names, rng=rng
+    )
+    new_names = [" ".join(str(n)).lower() for n in new_names]
+
+    batch_to_modify[colname] = np.where(pd.isnull(orig_names), None, new_names)
+    return batch_to_modify
+
+
 ######################################
 # FOR ALSPAC 
 ######################################
@@ -37,17 +307,13 @@ def alspac_G0_surname_gen_uncorrupted_record(formatted_master_record, record_to_
     return record_to_modify
 
 # Random first name (Random non-diminutive first name)
-def alspac_first_name_random(formatted_master_record, record_to_modify={}):
+def alspac_first_name_random(formatted_master_record, record_to_modify={}, rng=None):
     
     orig_firstname = formatted_master_record['G1_firstname']
-    first_name_alt_lookup = get_given_name_alternatives_lookup()
-    new_firstname = random.choice(list(first_name_alt_lookup.keys()))
-    while new_firstname == orig_firstname:
-        new_firstname = random.choice(list(first_name_alt_lookup.keys()))
-        if new_firstname != orig_firstname:
-            continue
-
-    if orig_firstname is None:
+    new_firstname = get_given_name_index().random_names(exclude=orig_firstname, rng=rng)
+
+    # Nulls may be None or NaN, as in alspac_first_name_random_batch
+    if pd.isnull(orig_firstname):
         record_to_modify["G1_firstname"] = None
         return record_to_modify
 
@@ -56,19 +322,24 @@ def alspac_first_name_random(formatted_master_record, record_to_modify={}):
     return record_to_modify
 
 
+def alspac_first_name_random_batch(formatted_master_batch, batch_to_modify, rng=None):
+    return _random_name_batch(
+        formatted_master_batch,
+        batch_to_modify,
+        "G1_firstname",
+        get_given_name_index(),
+        rng=rng,
+    )
+
+
 #random G1 last name - married/devorced
 
-def alspac_G1_surname_random(formatted_master_record, record_to_modify={}):
+def alspac_G1_surname_random(formatted_master_record, record_to_modify={}, rng=None):
     
     orig_surname = formatted_master_record['G1_surname']
-    family_name_alt_lookup = get_family_name_alternatives_lookup()
-    new_surname = random.choice(list(family_name_alt_lookup.keys()))
-    while new_surname == orig_surname:
-        new_surname = random.choice(list(family_name_alt_lookup.keys()))
-        if new_surname != orig_surname:
-            continue
-
-    if orig_surname is None:
+    new_surname = get_family_name_index().random_names(exclude=orig_surname, rng=rng)
+
+    if pd.isnull(orig_surname):
         record_to_modify["G1_surname"] = None
         return record_to_modify
 
@@ -76,19 +347,23 @@ def alspac_G1_surname_random(formatted_master_record, record_to_modify={}):
 
     return record_to_modify
 
+
+def alspac_G1_surname_random_batch(formatted_master_batch, batch_to_modify, rng=None):
+    return _random_name_batch(
+        formatted_master_batch,
+        batch_to_modify,
+        "G1_surname",
+        get_family_name_index(),
+        rng=rng,
+    )
+
 #random G0 last name - married/devorced
-def alspac_G0_surname_random(formatted_master_record, record_to_modify={}):
+def alspac_G0_surname_random(formatted_master_record, record_to_modify={}, rng=None):
     
     orig_surname = formatted_master_record['G0_surname']
-    family_name_alt_lookup = get_family_name_alternatives_lookup()
-    new_surname = random.choice(list(family_name_alt_lookup.keys()))
+    new_surname = get_family_name_index().random_names(exclude=orig_surname, rng=rng)
 
-    while new_surname == orig_surname:
-        new_surname = random.choice(list(family_name_alt_lookup.keys()))
-        if new_surname != orig_surname:
-            continue
-
-    if orig_surname is None:
+    if pd.isnull(orig_surname):
         record_to_modify["G0_surname"] = None
         return record_to_modify
 
@@ -96,26 +371,37 @@ def alspac_G0_surname_random(formatted_master_record, record_to_modify={}):
 
     return record_to_modify
 
+
+def alspac_G0_surname_random_batch(formatted_master_batch, batch_to_modify, rng=None):
+    return _random_name_batch(
+        formatted_master_batch,
+        batch_to_modify,
+        "G0_surname",
+        get_family_name_index(),
+        rng=rng,
+    )
+
 #alspac alternative first names
 
-def alspac_first_name_alternatives(formatted_master_record, record_to_modify={}):
+def alspac_first_name_alternatives(formatted_master_record, record_to_modify={}, rng=None):
     """ choose alternative first names"""
     
     given = formatted_master_record["G1_firstname"]
     
-    if given is None:
+    # Nulls may be None or NaN, as in alspac_first_name_alternatives_batch
+    if pd.isnull(given):
         record_to_modify["G1_firstname"] = None
         return record_to_modify
     
 
-    given_name_alt_lookup = get_given_name_alternatives_lookup()
+    given_name_sampler = get_given_name_sampler()
+    position = formatted_master_record.get("G1_firstname_alt_position")
     
     output_names = []
-    if given in given_name_alt_lookup:
-        name_dict = given_name_alt_lookup[given]
-        alt_names = name_dict["alt_name_arr"]
-        weights = name_dict["alt_name_weight_arr"]
-        output_names.append(np.random.choice(alt_names, p=weights))
+    if position is not None and position >= 0:
+        output_names.append(given_name_sampler.sample_positions([position], rng=rng)[0])
+    elif position is None and given in given_name_sampler:
+        output_names.append(given_name_sampler.sample_one(given, rng=rng))
     else:
         output_names.append(given)
 
@@ -123,11 +409,28 @@ def alspac_first_name_alternatives(formatted_master_record, record_to_modify={})
 
     return record_to_modify
 
-def alspac_first_name_insertion(formatted_master_record, record_to_modify):
+
+def alspac_first_name_alternatives_batch(
+    formatted_master_batch, batch_to_modify, rng=None
+):
+    given = formatted_master_batch["G1_firstname"].to_numpy(dtype=object)
+
+    # Use the positions joined on by attach_alt_name_positions, if present
+    if "G1_firstname_alt_position" in formatted_master_batch.columns:
+        positions = formatted_master_batch["G1_firstname_alt_position"].to_numpy()
+        alt_names = get_given_name_sampler().sample_positions(positions, rng=rng)
+    else:
+        alt_names = get_given_name_sampler().sample(given, rng=rng)
+    output_names = np.where(pd.isnull(alt_names), given, alt_names)
+    output_names = [" ".join(str([n])).lower() for n in output_names]
+
+    batch_to_modify["G1_firstname"] = np.where(pd.isnull(given), None, output_names)
+    return batch_to_modify
+
+def alspac_first_name_insertion(formatted_master_record, record_to_modify, rng=None):
     """insertion of extra term in first name"""
     given = str(formatted_master_record['G1_firstname'])
-    first_name_alt_lookup = get_given_name_alternatives_lookup()
-    new_firstname = str(random.choice(list(first_name_alt_lookup.keys())))
+    new_firstname = str(get_given_name_index().random_names(rng=rng))
 
     if given is None or given == "":
        record_to_modify["G1_firstname"] = new_firstname
@@ -136,7 +439,7 @@ def alspac_first_name_insertion(formatted_master_record, record_to_modify):
 
     return record_to_modify
 
-def alspac_first_name_deletion(formatted_master_record, record_to_modify):
+def alspac_first_name_deletion(formatted_master_record, record_to_modify, rng=None):
     orig_firstname = str(formatted_master_record['G1_firstname'])
     """deletion of extra term in first name"""
     num_of_terms = str(orig_firstname).count(" ") + 1 
@@ -148,7 +451,7 @@ def alspac_first_name_deletion(formatted_master_record, record_to_modify):
     new_name = orig_firstname.split(" ")
     if num_of_terms == 2:
         first_term = new_name.pop(0)
-        second_term = new_name
+        second_term = new_name.pop(0)
     elif num_of_terms == 3:
         first_term = new_name.pop(0)
         second_term = new_name.pop(0)
@@ -161,48 +464,48 @@ def alspac_first_name_deletion(formatted_master_record, record_to_modify):
 
 
     # count number of terms, and condition on it
+    rng = get_rng(rng)
     if num_of_terms >= 4:
-        if random.randint(1,4)==1:
+        if rng.integers(1,5)==1:
             new_name = second_term.lower() + " " + third_term.lower() + " " + forth_term.lower()
             record_to_modify["G1_firstname"] = new_name
-        elif random.randint(1,4)==2:
+        elif rng.integers(1,5)==2:
             new_name = first_term.lower() + " " + third_term.lower() + " " + forth_term.lower()
             record_to_modify["G1_firstname"] = new_name
-        elif random.randint(1,4)==3:
+        elif rng.integers(1,5)==3:
             new_name = first_term.lower() + " " + second_term.lower() + " " + forth_term.lower()
             record_to_modify["G1_firstname"] = new_name
-        elif random.randint(1,4)==4:
+        elif rng.integers(1,5)==4:
             new_name = first_term.lower() + " " + second_term.lower() + " " + third_term.lower()
             record_to_modify["G1_firstname"] = new_name
     elif num_of_terms == 3:
-        if random.randint(1,3)==1:
+        if rng.integers(1,4)==1:
             new_name = second_term.lower() + " " + third_term.lower()
             record_to_modify["G1_firstname"] = new_name
-        elif random.randint(1,3)==2:
+        elif rng.integers(1,4)==2:
             new_name = first_term.lower() + " " + third_term.lower()
             record_to_modify["G1_firstname"] = new_name
-        elif random.randint(1,3)==3:
+        elif rng.integers(1,4)==3:
             new_name = second_term.lower() + " " + third_term.lower()
             record_to_modify["G1_firstname"] = new_name
     elif num_of_terms == 2:
-        if random.randint(1,2)==1:
+        if rng.integers(1,3)==1:
             new_name = first_term
             record_to_modify["G1_firstname"] = new_name
-        elif random.randint(1,2)==2:
+        elif rng.integers(1,3)==2:
             new_name = second_term
             record_to_modify["G1_firstname"] = new_name
 
     return record_to_modify
 
 
-def alspac_G1_last_name_insertion(formatted_master_record, record_to_modify):
+def alspac_G1_last_name_insertion(formatted_master_record, record_to_modify, rng=None):
     """insert extra term in surname"""
     
     options = str(formatted_master_record['G1_surname'])
     
     lastname_orig = options
-    family_name_alt_lookup = get_family_name_alternatives_lookup()
-    new_surname = str(random.choice(list(family_name_alt_lookup.keys())))
+    new_surname = str(get_family_name_index().random_names(rng=rng))
     
     if options is None or options == "":
         record_to_modify["G1_surname"] = new_surname
@@ -211,7 +514,7 @@ def alspac_G1_last_name_insertion(formatted_master_record, record_to_modify):
     return record_to_modify
 
 
-def alspac_G1_last_name_deletion(formatted_master_record, record_to_modify):
+def alspac_G1_last_name_deletion(formatted_master_record, record_to_modify, rng=None):
     """deletion of extra term in surname"""
 
     orig_lastname = str(formatted_master_record['G1_surname'])
@@ -224,7 +527,7 @@ def alspac_G1_last_name_deletion(formatted_master_record, record_to_modify):
     new_name = orig_lastname.split(" ")
     if num_of_terms == 2:
         first_term = new_name.pop(0)
-        second_term = new_name
+        second_term = new_name.pop(0)
     elif num_of_terms == 3:
         first_term = new_name.pop(0)
         second_term = new_name.pop(0)
@@ -237,48 +540,48 @@ def alspac_G1_last_name_deletion(formatted_master_record, record_to_modify):
 
 
     # count number of terms, and condition on it
+    rng = get_rng(rng)
     if num_of_terms >= 4:
-        if random.randint(1,4)==1:
+        if rng.integers(1,5)==1:
             new_name = second_term.lower() + " " + third_term.lower() + " " + forth_term.lower()
             record_to_modify["G1_surname"] = new_name
-        elif random.randint(1,4)==2:
+        elif rng.integers(1,5)==2:
             new_name = first_term.lower() + " " + third_term.lower() + " " + forth_term.lower()
             record_to_modify["G1_surname"] = new_name
-        elif random.randint(1,4)==3:
+        elif rng.integers(1,5)==3:
             new_name = first_term.lower() + " " + second_term.lower() + " " + forth_term.lower()
             record_to_modify["G1_surname"] = new_name
-        elif random.randint(1,4)==4:
+        elif rng.integers(1,5)==4:
             new_name = first_term.lower() + " " + second_term.lower() + " " + third_term.lower()
             record_to_modify["G1_surname"] = new_name
     elif num_of_terms == 3:
-        if random.randint(1,3)==1:
+        if rng.integers(1,4)==1:
             new_name = second_term.lower() + " " + third_term.lower()
             record_to_modify["G1_surname"] = new_name
-        elif random.randint(1,3)==2:
+        elif rng.integers(1,4)==2:
             new_name = first_term.lower() + " " + third_term.lower()
             record_to_modify["G1_surname"] = new_name
-        elif random.randint(1,3)==3:
+        elif rng.integers(1,4)==3:
             new_name = first_term.lower() + " " + second_term.lower()
             record_to_modify["G1_surname"] = new_name
     elif num_of_terms == 2:
-        if random.randint(1,2)==1:
+        if rng.integers(1,3)==1:
             new_name = first_term
             record_to_modify["G1_surname"] = new_name
-        elif random.randint(1,2)==2:
+        elif rng.integers(1,3)==2:
             new_name = second_term
             record_to_modify["G1_surname"] = new_name
 
     return record_to_modify
 
-def alspac_G0_last_name_insertion(formatted_master_record, record_to_modify):
+def alspac_G0_last_name_insertion(formatted_master_record, record_to_modify, rng=None):
     """insert extra term in surname"""
     
     options = str(formatted_master_record["G0_surname"])
 
     
     lastname_orig = options
-    family_name_alt_lookup = get_family_name_alternatives_lookup()
-    new_surname = str(random.choice(list(family_name_alt_lookup.keys())))
+    new_surname = str(get_family_name_index().random_names(rng=rng))
     
     if options is None or options == "":
         record_to_modify["G0_surname"] = new_surname
@@ -287,7 +590,7 @@ def alspac_G0_last_name_insertion(formatted_master_record, record_to_modify):
     return record_to_modify
 
 
-def alspac_G0_last_name_deletion(formatted_master_record, record_to_modify):
+def alspac_G0_last_name_deletion(formatted_master_record, record_to_modify, rng=None):
     """deletion of extra term in surname"""
 
     orig_lastname = str(formatted_master_record['G0_surname'])
@@ -300,7 +603,7 @@ def alspac_G0_last_name_deletion(formatted_master_record, record_to_modify):
     new_name = orig_lastname.split(" ")
     if num_of_terms == 2:
         first_term = new_name.pop(0)
-        second_term = new_name
+        second_term = new_name.pop(0)
     elif num_of_terms == 3:
         first_term = new_name.pop(0)
         second_term = new_name.pop(0)
@@ -313,41 +616,42 @@ def alspac_G0_last_name_deletion(formatted_master_record, record_to_modify):
 
 
     # count number of terms, and condition on it
+    rng = get_rng(rng)
     if num_of_terms >= 4:
-        if random.randint(1,4)==1:
+        if rng.integers(1,5)==1:
             new_name = second_term.lower() + " " + third_term.lower() + " " + forth_term.lower()
             record_to_modify["G0_surname"] = new_name
-        elif random.randint(1,4)==2:
+        elif rng.integers(1,5)==2:
             new_name = first_term.lower() + " " + third_term.lower() + " " + forth_term.lower()
             record_to_modify["G0_surname"] = new_name
-        elif random.randint(1,4)==3:
+        elif rng.integers(1,5)==3:
             new_name = first_term.lower() + " " + second_term.lower() + " " +  forth_term.lower()
             record_to_modify["G0_surname"] = new_name
-        elif random.randint(1,4)==4:
+        elif rng.integers(1,5)==4:
             new_name = first_term.lower() + " " + second_term.lower() + " " + third_term.lower() 
             record_to_modify["G0_surname"] = new_name
     elif num_of_terms == 3:
-        if random.randint(1,3)==1:
+        if rng.integers(1,4)==1:
             new_name = second_term.lower() + " " + third_term.lower()
             record_to_modify["G0_surname"] = new_name
-        elif random.randint(1,3)==2:
+        elif rng.integers(1,4)==2:
             new_name = first_term.lower() + " " + third_term.lower()
             record_to_modify["G0_surname"] = new_name
-        elif random.randint(1,3)==3:
+        elif rng.integers(1,4)==3:
             new_name = first_term.lower() + " " + second_term.lower()
             record_to_modify["G0_surname"] = new_name
     elif num_of_terms == 2:
-        if random.randint(1,2)==1:
+        if rng.integers(1,3)==1:
             new_name = first_term
             record_to_modify["G0_surname"] = new_name
-        elif random.randint(1,2)==2:
+        elif rng.integers(1,3)==2:
             new_name = second_term
             record_to_modify["G0_surname"] = new_name
 
     return record_to_modify
 
 
-def alspac_first_name_typo(formatted_master_record, record_to_modify={}):
+def alspac_first_name_typo(formatted_master_record, record_to_modify={}, rng=None):
 
     options = str(formatted_master_record["G1_firstname"])
 
@@ -361,11 +665,11 @@ def alspac_first_name_typo(formatted_master_record, record_to_modify={}):
         position_function=position_mod_uniform, row_prob=0.5, col_prob=0.5
     )
 
-    record_to_modify["G1_firstname"] = querty_corruptor.corrupt_value(first_name)
+    record_to_modify["G1_firstname"] = querty_corruptor.corrupt_value(first_name, rng=rng)
 
     return record_to_modify
 
-def alspac_G1_last_name_typo(formatted_master_record, record_to_modify={}):
+def alspac_G1_last_name_typo(formatted_master_record, record_to_modify={}, rng=None):
 
     options = str(formatted_master_record["G1_surname"])
 
@@ -379,11 +683,11 @@ def alspac_G1_last_name_typo(formatted_master_record, record_to_modify={}):
         position_function=position_mod_uniform, row_prob=0.5, col_prob=0.5
     )
 
-    record_to_modify["G1_surname"] = querty_corruptor.corrupt_value(last_name)
+    record_to_modify["G1_surname"] = querty_corruptor.corrupt_value(last_name, rng=rng)
 
     return record_to_modify
 
-def alspac_G0_last_name_typo(formatted_master_record, record_to_modify={}):
+def alspac_G0_last_name_typo(formatted_master_record, record_to_modify={}, rng=None):
 
     options = str(formatted_master_record["G0_surname"])
 
@@ -397,11 +701,11 @@ def alspac_G0_last_name_typo(formatted_master_record, record_to_modify={}):
         position_function=position_mod_uniform, row_prob=0.5, col_prob=0.5
     )
 
-    record_to_modify["G0_surname"] = querty_corruptor.corrupt_value(last_name)
+    record_to_modify["G0_surname"] = querty_corruptor.corrupt_value(last_name, rng=rng)
 
     return record_to_modify
 
-def alspac_name_inversion(formatted_master_record, record_to_modify):
+def alspac_name_inversion(formatted_master_record, record_to_modify, rng=None):
 
     given = str(formatted_master_record["G1_firstname"])
     family = str(formatted_master_record["G1_surname"])
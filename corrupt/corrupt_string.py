@@ -12,6 +12,7 @@ def string_corrupt_numpad(
     record_to_modify={},
     row_prob=0.5,
     col_prob=0.5,
+    rng=None,
 ):
     input_value = formatted_master_record[input_colname]
     if not input_value:
@@ -23,7 +24,7 @@ def string_corrupt_numpad(
     )
     input_value_as_str = str(input_value)
     record_to_modify[output_colname] = numpad_corruptor.corrupt_value(
-        input_value_as_str
+        input_value_as_str, rng=rng
     )
 
     return record_to_modify
@@ -36,6 +37,7 @@ def string_corrupt_querty_keyboard(
     record_to_modify={},
     row_prob=0.5,
     col_prob=0.5,
+    rng=None,
 ):
     input_value = formatted_master_record[input_colname]
 
@@ -49,7 +51,7 @@ def string_corrupt_querty_keyboard(
 
     input_value_as_str = str(input_value)
     record_to_modify[output_colname] = querty_corruptor.corrupt_value(
-        input_value_as_str
+        input_value_as_str, rng=rng
     )
 
     return record_to_modify
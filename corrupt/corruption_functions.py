@@ -61,6 +61,8 @@ def format_master_record_first_array_item(master_input_record, colname):
     return master_input_record
 
 
-def null_corruption(formatted_master_record, record_to_modify, output_colname):
+def null_corruption(
+    formatted_master_record, record_to_modify, output_colname, rng=None
+):
     record_to_modify[output_colname] = None
     return record_to_modify
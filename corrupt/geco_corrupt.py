@@ -17,10 +17,11 @@
 #
 # =============================================================================
 
-import random
 import types
 import numpy as np
 
+from corrupt.record_rng import get_rng
+
 
 def check_is_non_empty_string(variable, value):
     """Check if the value given is of type string and is not an empty string.
@@ -64,8 +65,9 @@ def check_is_normalised(variable, value):
         )
 
 
-def position_mod_uniform(in_str):
-    """Select any position in the given input string with uniform likelihood.
+def position_mod_uniform(in_str, rng=None):
+    """Select any position in the given input string with uniform likelihood,
+    using rng, a numpy Generator.
 
     Return 0 is the string is empty.
     """
@@ -75,7 +77,8 @@ def position_mod_uniform(in_str):
 
     max_pos = len(in_str) - 1
 
-    pos = random.randint(0, max_pos)  # String positions start at 0
+    rng = get_rng(rng)
+    pos = int(rng.integers(0, max_pos + 1))  # String positions start at 0
 
     return pos
 
@@ -109,8 +112,9 @@ class CorruptValue:
     position_function  A function that (somehow) determines the location
                        within a string value of where a modification
                        (corruption) is to be applied. The input of this
-                       function is assumed to be a string and its return value
-                       an integer number in the range of the length of the
+                       function is assumed to be a string, and a numpy
+                       Generator to draw from, and its return value an
+                       integer number in the range of the length of the
                        given input string.
     """
 
@@ -150,9 +154,9 @@ class CorruptValue:
 
     # ---------------------------------------------------------------------------
 
-    def corrupt_value(self, str):
+    def corrupt_value(self, str, rng=None):
         """Method which corrupts the given input string and returns the modified
-        string.
+        string, drawing from rng, a numpy Generator.
         See implementations in derived classes for details.
         """
 
@@ -306,15 +310,18 @@ class CorruptValueQuerty(CorruptValue):
 
     # ---------------------------------------------------------------------------
 
-    def corrupt_value(self, in_str):
+    def corrupt_value(self, in_str, rng=None):
         """Method which corrupts the given input string by replacing a single
         character with a neighbouring character given the defined keyboard
         layout at a position randomly selected by the position function.
+        rng is the numpy Generator to draw from.
         """
 
         if len(in_str) == 0:  # Empty string, no modification possible
             return in_str
 
+        rng = get_rng(rng)
+
         max_try = 10  # Maximum number of tries to find a keyboard modification at
         # a randomly selected position
 
@@ -325,10 +332,10 @@ class CorruptValueQuerty(CorruptValue):
 
         while (done_key_mod == False) and (try_num < max_try):
 
-            mod_pos = self.position_function(mod_str)
+            mod_pos = self.position_function(mod_str, rng)
             mod_char = mod_str[mod_pos]
 
-            r = random.random()  # Create a random number between 0 and 1
+            r = rng.random()  # Create a random number between 0 and 1
 
             if r <= self.row_prob:  # See if there is a row modification
                 if mod_char in self.rows:
@@ -349,7 +356,7 @@ class CorruptValueQuerty(CorruptValue):
 
             # Randomly select one of the possible characters
             #
-            new_char = random.choice(key_mod_chars)
+            new_char = key_mod_chars[rng.integers(len(key_mod_chars))]
 
             mod_str = mod_str[:mod_pos] + new_char + mod_str[mod_pos + 1 :]
 
@@ -453,15 +460,18 @@ class CorruptValueNumpad(CorruptValue):
 
     # ---------------------------------------------------------------------------
 
-    def corrupt_value(self, in_str):
+    def corrupt_value(self, in_str, rng=None):
         """Method which corrupts the given input string by replacing a single
         character with a neighbouring character given the defined keyboard
         layout at a position randomly selected by the position function.
+        rng is the numpy Generator to draw from.
         """
 
         if len(in_str) == 0:  # Empty string, no modification possible
             return in_str
 
+        rng = get_rng(rng)
+
         max_try = 10  # Maximum number of tries to find a keyboard modification at
         # a randomly selected position
 
@@ -472,10 +482,10 @@ class CorruptValueNumpad(CorruptValue):
 
         while (done_key_mod == False) and (try_num < max_try):
 
-            mod_pos = self.position_function(mod_str)
+            mod_pos = self.position_function(mod_str, rng)
             mod_char = mod_str[mod_pos]
 
-            r = random.random()  # Create a random number between 0 and 1
+            r = rng.random()  # Create a random number between 0 and 1
 
             if r <= self.row_prob:  # See if there is a row modification
                 if mod_char in self.rows:
@@ -496,7 +506,7 @@ class CorruptValueNumpad(CorruptValue):
 
             # Randomly select one of the possible characters
             #
-            new_char = random.choice(key_mod_chars)
+            new_char = key_mod_chars[rng.integers(len(key_mod_chars))]
 
             mod_str = mod_str[:mod_pos] + new_char + mod_str[mod_pos + 1 :]
 
@@ -0,0 +1,106 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class ParquetRecordSink:
+    """Streams output records to a parquet file, so the records never all need
+    to be held in memory at once.
+
+    Records are converted to arrow as soon as they are written, and buffered
+    until there are at least buffer_size of them, at which point they are
+    appended to the file as a row group.
+
+    All records are written with a fixed schema.  If schema is None, it is
+    inferred from the first records written.
+
+    Records are written to a temporary file next to out_path, which is only
+    renamed to out_path by close(), so a sink that fails part way through
+    never leaves a partial file that looks like a complete one.
+
+    Use as a context manager, or call close() when done:
+
+        with ParquetRecordSink(out_path, schema) as sink:
+            for records in batches:
+                sink.write_records(records)
+
+    If the block raises, the temporary file is deleted (see abort())
+    """
+
+    def __init__(self, out_path, schema=None, buffer_size=100_000):
+        self.out_path = out_path
+        self.tmp_path = f"{out_path}.tmp"
+        self.schema = schema
+        self.buffer_size = buffer_size
+        self.writer = None
+        self.buffer = []
+        self.num_buffered_records = 0
+        self.num_records_written = 0
+
+    def _to_record_batch(self, records):
+        if isinstance(records, pd.DataFrame):
+            return pa.RecordBatch.from_pandas(
+                records, schema=self.schema, preserve_index=False
+            )
+        else:
+            return pa.RecordBatch.from_pylist(records, schema=self.schema)
+
+    def write_records(self, records):
+        """records is a list of dicts, or a pandas dataframe"""
+        if len(records) == 0:
+            return
+
+        record_batch = self._to_record_batch(records)
+        if self.schema is None:
+            self.schema = record_batch.schema
+
+        self.buffer.append(record_batch)
+        self.num_buffered_records += record_batch.num_rows
+
+        if self.num_buffered_records >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp_path, self.schema)
+
+        self.writer.write_table(pa.Table.from_batches(self.buffer, self.schema))
+        self.num_records_written += self.num_buffered_records
+
+        self.buffer = []
+        self.num_buffered_records = 0
+
+    def close(self):
+        self.flush()
+
+        # Always produce a file, even if no records were written
+        if self.writer is None and self.schema is not None:
+            self.writer = pq.ParquetWriter(self.tmp_path, self.schema)
+
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.tmp_path, self.out_path)
+
+    def abort(self):
+        """Discard everything written so far, without producing a file"""
+        self.buffer = []
+        self.num_buffered_records = 0
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
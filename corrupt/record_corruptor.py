@@ -1,8 +1,11 @@
 from functools import partial
-import random
 import logging
+import numpy as np
 import pandas as pd
-import duckdb
+import pyarrow
+
+from corrupt.record_rng import get_rng, rngs_per_record, select_rngs, uniforms
+from path_fns.duckdb_connection import get_connection
 
 
 logger = logging.getLogger(__name__)
@@ -16,6 +19,15 @@ def bayes_factor_to_prob(bf):
     return bf / (1 + bf)
 
 
+def prob_to_log_odds(prob):
+    with np.errstate(divide="ignore"):
+        return np.log(prob) - np.log1p(-prob)
+
+
+def log_odds_to_prob(log_odds):
+    return 1 / (1 + np.exp(-log_odds))
+
+
 class CompositeCorruption:
     """This class models a 'composite corruption' - i.e. one or more corruptions
     which happen simultanously.
@@ -33,13 +45,26 @@ class CompositeCorruption:
     def __init__(self, name="", baseline_probability=0.1):
         self.name = name
         self.functions = []
+        self.batch_functions = []
         self.baseline_probability = baseline_probability
         self.adjusted_probability = None
 
-    def add_corruption_function(self, fn, args):
+    def add_corruption_function(self, fn, args, batch_fn=None):
+        """fn corrupts a single record, with signature
+        fn(formatted_master_record, record_to_modify, rng=rng, **args) where rng
+        is the numpy Generator of the record.  Optionally, batch_fn is an
+        equivalent function that corrupts many records at once, with signature
+        batch_fn(formatted_master_batch, batch_to_modify, rng=rng, **args) where
+        both arguments are dataframes, and rng is a Generator, or a list of one
+        Generator per row, returning the modified batch_to_modify
+        """
         curried = partial(fn, **args)
         self.functions.append(curried)
 
+        if batch_fn is not None:
+            batch_fn = partial(batch_fn, **args)
+        self.batch_functions.append(batch_fn)
+
     def reset_probability(self):
         self.adjusted_probability = self.baseline_probability
 
@@ -48,22 +73,18 @@ class CompositeCorruption:
         bf = bf * bayes_factor_adjustment
         self.adjusted_probability = bayes_factor_to_prob(bf)
 
-    def apply_corruptions(
-        self,
-        formatted_master_data,
-        record_to_modify,
-    ):
-        """
+    def apply_corruptions(self, formatted_master_data, record_to_modify, rng=None):
         logger.debug(
             f"Probability {self.name} composite corruption will be selected is "
             f"{self.adjusted_probability}"
         )
 
-        if random.uniform(0, 1) < self.adjusted_probability:
+        rng = get_rng(rng)
+        if rng.random() < self.adjusted_probability:
             self.reset_probability()
             record_to_modify_before = str(record_to_modify)
             for fn in self.functions:
-                record_to_modify = fn(formatted_master_data, record_to_modify)
+                record_to_modify = fn(formatted_master_data, record_to_modify, rng=rng)
 
             if record_to_modify_before != str(record_to_modify):
                 record_to_modify["corruptions_applied"].append(self.name)
@@ -72,7 +93,55 @@ class CompositeCorruption:
         else:
             self.reset_probability()
             return record_to_modify
-"""
+
+    def apply_corruptions_to_batch(
+        self, formatted_master_batch, batch_to_modify, selected, rng=None
+    ):
+        """Apply the corruption functions to the rows of batch_to_modify at the
+        positions in selected, modifying batch_to_modify in place.
+
+        Functions with a batch_fn are called once on all the selected rows.  Other
+        functions are called record by record, but only on the selected rows.
+
+        rng is a numpy Generator, or a list of Generators, one per row of
+        batch_to_modify, in which case each row draws only from its own
+        Generator
+
+        Returns a boolean array, aligned to selected, which is True where the
+        corruptions changed the row
+        """
+        master_subset = formatted_master_batch.iloc[selected]
+        subset = batch_to_modify.iloc[selected]
+        subset_rng = select_rngs(get_rng(rng), selected)
+        before = subset.copy()
+
+        for fn, batch_fn in zip(self.functions, self.batch_functions):
+            if batch_fn is not None:
+                subset = batch_fn(master_subset, subset.copy(), rng=subset_rng)
+            else:
+                master_records = master_subset.to_dict(orient="records")
+                records = subset.to_dict(orient="records")
+                record_rngs = rngs_per_record(subset_rng, len(records))
+                records = [
+                    fn(m, r, rng=record_rng)
+                    for m, r, record_rng in zip(master_records, records, record_rngs)
+                ]
+                subset = pd.DataFrame(records, index=subset.index)
+
+        new_columns = [c for c in subset.columns if c not in batch_to_modify.columns]
+        for col in new_columns:
+            batch_to_modify[col] = None
+        batch_to_modify.loc[subset.index, subset.columns] = subset.astype(object)
+
+        # Nulls compare unequal, and may be NaN before and None after, so a value
+        # that is null before and after is unchanged
+        after = subset.reindex(columns=before.columns).astype(object)
+        unchanged = (after == before) | (after.isna() & before.isna())
+        changed = (~unchanged).any(axis=1).to_numpy()
+        if new_columns:
+            changed[:] = True
+        return changed
+
 
 class ProbabilityAdjustmentFromLookup:
     def __init__(self, lookup):
@@ -120,6 +189,27 @@ class ProbabilityAdjustmentFromLookup:
 
         return adjustment_tuples
 
+    def get_adjustment_masks(self, records, sql_condition_matrix=None):
+        """
+        Vectorised equivalent of get_adjustment_tuples for a dataframe of records.
+        Returns a list of tuples like:
+        [
+            (name_inversion_corruption, mask, 0.1),
+        ]
+        where mask is a boolean array with one element per record, which is True
+        for the records to which the adjustment applies
+        """
+        adjustment_masks = []
+        for record_column, lookup in self.adjustment_lookup.items():
+            record_values = records[record_column]
+
+            for record_value, adjustment_tuples in lookup.items():
+                mask = (record_values == record_value).to_numpy(dtype=bool)
+                for corruption, bayes_factor in adjustment_tuples:
+                    adjustment_masks.append((corruption, mask, bayes_factor))
+
+        return adjustment_masks
+
 
 class ProbabilityAdjustmentFromSQL:
     def __init__(self, sql, composite_corruption: CompositeCorruption, bayes_factor):
@@ -130,9 +220,18 @@ class ProbabilityAdjustmentFromSQL:
         self.sql = sql
         self.composite_corruption = composite_corruption
         self.bayes_factor = bayes_factor
-        self.con = duckdb.connect()
+        self._con = None
 
-    def get_adjustment_tuples(self, record):
+    @property
+    def con(self):
+        # Only connect when first needed, so building a RecordCorruptor with many
+        # adjustments, e.g. once per worker process, doesn't open many connections.
+        # A cursor of the shared connection, so the registered df is private
+        if self._con is None:
+            self._con = get_connection().cursor()
+        return self._con
+
+    def condition_matches(self, record):
 
         df = pd.DataFrame([record])
 
@@ -141,8 +240,9 @@ class ProbabilityAdjustmentFromSQL:
         select {self.sql} as condition_matches
         from df
         """
-        matches = self.con.execute(sql).fetchone()[0]
+        return self.con.execute(sql).fetchone()[0]
 
+    def adjustment_tuples_from_match(self, matches):
         if matches:
             adjustment_tuples = [(self.composite_corruption, self.bayes_factor)]
             logger.debug(
@@ -153,6 +253,78 @@ class ProbabilityAdjustmentFromSQL:
         else:
             return []
 
+    def get_adjustment_tuples(self, record):
+        return self.adjustment_tuples_from_match(self.condition_matches(record))
+
+    def get_adjustment_masks(self, records, sql_condition_matrix):
+        mask = sql_condition_matrix.condition_column(self.sql)
+        return [(self.composite_corruption, mask, self.bayes_factor)]
+
+
+class SQLConditionMatrix:
+    """Holds the result of evaluating every distinct SQL condition against every
+    record of an input table in a single query.
+
+    The result is a boolean matrix of shape (num records, num conditions), so
+    that whether a condition matches a record is an array lookup rather than
+    a DuckDB round-trip per record.
+    """
+
+    def __init__(self, conditions, matrix):
+        self.column_lookup = {sql: i for i, sql in enumerate(conditions)}
+        self.matrix = matrix
+
+    @classmethod
+    def from_records(cls, conditions, records, con=None):
+        """Evaluate the conditions against records, a pandas dataframe or arrow
+        table with one row per record, in a single pass
+        """
+        conditions = list(dict.fromkeys(conditions))
+
+        if con is None:
+            con = get_connection().cursor()
+
+        num_records = len(records)
+        if not conditions:
+            return cls(conditions, np.zeros((num_records, 0), dtype=bool))
+
+        if isinstance(records, pd.DataFrame):
+            records = pyarrow.Table.from_pandas(records, preserve_index=False)
+
+        # Columns which are entirely null (e.g. in a small batch of records) are
+        # often typed as DOUBLE, so comparisons with strings would fail
+        for i, field in enumerate(records.schema):
+            if records.column(i).null_count == num_records:
+                records = records.set_column(
+                    i, field.name, pyarrow.nulls(num_records)
+                )
+
+        # Row order isn't guaranteed to be preserved by DuckDB, so carry an
+        # explicit index through the query
+        records = records.append_column("__record_index", [np.arange(num_records)])
+
+        con.register("records_to_corrupt", records)
+
+        select_conditions = ",\n".join(
+            f"coalesce(({sql}), false) as condition_{i}"
+            for i, sql in enumerate(conditions)
+        )
+        sql = f"""
+        select {select_conditions}
+        from records_to_corrupt
+        order by __record_index
+        """
+        df = con.execute(sql).df()
+        con.unregister("records_to_corrupt")
+
+        return cls(conditions, df.to_numpy(dtype=bool))
+
+    def condition_matches(self, sql, record_index):
+        return self.matrix[record_index, self.column_lookup[sql]]
+
+    def condition_column(self, sql):
+        return self.matrix[:, self.column_lookup[sql]]
+
 
 class RecordCorruptor:
     """This class applies composite corruptions to an input record"""
@@ -160,6 +332,7 @@ class RecordCorruptor:
     def __init__(self):
         self.corruptions: list[CompositeCorruption] = []
         self.probability_adjustments = []
+        self.sql_condition_matrix: SQLConditionMatrix = None
 
     def add_composite_corruption(self, composite_corruption: CompositeCorruption):
         self.corruptions.append(composite_corruption)
@@ -178,20 +351,91 @@ class RecordCorruptor:
     def add_probability_adjustment(self, adjustment):
         self.probability_adjustments.append(adjustment)
 
-    def probability_adjustment_tuples(self, record):
+    def precompute_sql_adjustments(self, records, con=None):
+        """Evaluate the conditions of all SQL probability adjustments against all
+        records in one query, rather than one query per record.
+
+        Once this has been called, pass record_index (the position of the record
+        in records) to apply_probability_adjustments to read from the
+        precomputed result
+        """
+        conditions = [
+            pa.sql
+            for pa in self.probability_adjustments
+            if isinstance(pa, ProbabilityAdjustmentFromSQL)
+        ]
+        self.sql_condition_matrix = SQLConditionMatrix.from_records(
+            conditions, records, con=con
+        )
+
+    def probability_adjustment_tuples(self, record, record_index=None):
         tuples = []
         for pa in self.probability_adjustments:
-            new_tuples = pa.get_adjustment_tuples(record)
+            if (
+                record_index is not None
+                and self.sql_condition_matrix is not None
+                and isinstance(pa, ProbabilityAdjustmentFromSQL)
+            ):
+                matches = self.sql_condition_matrix.condition_matches(
+                    pa.sql, record_index
+                )
+                new_tuples = pa.adjustment_tuples_from_match(matches)
+            else:
+                new_tuples = pa.get_adjustment_tuples(record)
             tuples.extend(new_tuples)
 
         return tuples
 
-    def apply_probability_adjustments(self, record):
+    def apply_probability_adjustments(self, record, record_index=None):
         for c in self.corruptions:
             c.reset_probability()
-        for corruption, bayes_factor in self.probability_adjustment_tuples(record):
+        for corruption, bayes_factor in self.probability_adjustment_tuples(
+            record, record_index
+        ):
             corruption.adjust_probability_using_bayes_factor(bayes_factor)
 
+    def baseline_probabilities(self):
+        return np.array([c.baseline_probability for c in self.corruptions])
+
+    def compile_log_odds(self, records, con=None):
+        """Fold the baseline probabilities and all probability adjustments into a
+        dense (num records, num corruptions) matrix of log odds that each
+        composite corruption is activated for each record.
+
+        records is a dataframe (or arrow table) of uncorrupted records.
+
+        Bayes factors are additive in log odds space, so unlike
+        apply_probability_adjustments, the result doesn't depend on the order
+        of the adjustments and no state is held on the composite corruptions
+        """
+        if not isinstance(records, pd.DataFrame):
+            records = records.to_pandas()
+
+        self.precompute_sql_adjustments(records, con=con)
+
+        corruption_index = {id(c): j for j, c in enumerate(self.corruptions)}
+
+        baseline_log_odds = prob_to_log_odds(self.baseline_probabilities())
+        log_odds = np.tile(baseline_log_odds, (len(records), 1))
+
+        for pa in self.probability_adjustments:
+            adjustment_masks = pa.get_adjustment_masks(
+                records, self.sql_condition_matrix
+            )
+            for corruption, mask, bayes_factor in adjustment_masks:
+                if id(corruption) not in corruption_index:
+                    continue
+                j = corruption_index[id(corruption)]
+                log_odds[mask, j] += np.log(bayes_factor)
+
+        return log_odds
+
+    def activation_probabilities(self, records, con=None):
+        """Returns a (num records, num corruptions) matrix of the probabilities
+        that each composite corruption is activated for each record in records
+        """
+        return log_odds_to_prob(self.compile_log_odds(records, con=con))
+
     def choose_functions_to_apply(self):
         functions = []
         for c in self.corruptions:
@@ -199,9 +443,77 @@ class RecordCorruptor:
             functions.extend(new_functions)
         return functions
 
-    def apply_corruptions_to_record(self, formatted_master_data, record_to_modify):
+    def apply_corruptions_to_record(
+        self, formatted_master_data, record_to_modify, rng=None
+    ):
+        rng = get_rng(rng)
         for c in self.corruptions:
             record_to_modify = c.apply_corruptions(
-                formatted_master_data, record_to_modify
+                formatted_master_data, record_to_modify, rng=rng
             )
         return record_to_modify
+
+    def apply_corruptions_to_batch(
+        self,
+        formatted_master_batch,
+        batch_to_modify,
+        activation_probabilities=None,
+        rng=None,
+    ):
+        """Columnar alternative to apply_corruptions_to_record.
+
+        formatted_master_batch and batch_to_modify are dataframes (or arrow
+        tables) with one row per record to corrupt, aligned by position.
+        activation_probabilities is a (num records, num corruptions) matrix, see
+        activation_probabilities.  If not provided, the baseline probabilities
+        are used.
+
+        Whether each composite corruption is activated is decided for every
+        record at once, and each composite corruption is only applied to the
+        records for which it was activated.
+
+        rng is a numpy Generator, or a list of Generators, one per record (see
+        corrupt.record_rng), in which case every draw for a record comes from
+        its own Generator, so its corruptions don't depend on which other
+        records are in the batch
+
+        Returns a dataframe of corrupted records
+        """
+        rng = get_rng(rng)
+
+        if not isinstance(formatted_master_batch, pd.DataFrame):
+            formatted_master_batch = formatted_master_batch.to_pandas()
+        if not isinstance(batch_to_modify, pd.DataFrame):
+            batch_to_modify = batch_to_modify.to_pandas()
+
+        formatted_master_batch = formatted_master_batch.reset_index(drop=True)
+        batch_to_modify = batch_to_modify.reset_index(drop=True).astype(object)
+
+        num_records = len(batch_to_modify)
+        if activation_probabilities is None:
+            activation_probabilities = self.baseline_probabilities()
+
+        if "corruptions_applied" in batch_to_modify.columns:
+            corruptions_applied = [
+                list(c) for c in batch_to_modify.pop("corruptions_applied")
+            ]
+        else:
+            corruptions_applied = [[] for _ in range(num_records)]
+
+        draws = uniforms(rng, (num_records, len(self.corruptions)))
+        activated = draws < activation_probabilities
+
+        for j, c in enumerate(self.corruptions):
+            selected = np.flatnonzero(activated[:, j])
+            logger.debug(f"{c.name} activated for {len(selected):,} records")
+            if len(selected) == 0:
+                continue
+
+            changed = c.apply_corruptions_to_batch(
+                formatted_master_batch, batch_to_modify, selected, rng=rng
+            )
+            for i in selected[changed]:
+                corruptions_applied[i].append(c.name)
+
+        batch_to_modify["corruptions_applied"] = corruptions_applied
+        return batch_to_modify
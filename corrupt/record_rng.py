@@ -0,0 +1,94 @@
+import hashlib
+
+import numpy as np
+
+
+def record_key(record_id):
+    """A non negative integer identifying a record, for keying its random
+    stream.  Non negative integer ids are used as they are, anything else
+    (e.g. a string id) is hashed
+    """
+    if isinstance(record_id, float) and record_id.is_integer():
+        record_id = int(record_id)
+    if isinstance(record_id, (int, np.integer)) and record_id >= 0:
+        return int(record_id)
+    digest = hashlib.blake2b(str(record_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def record_rng(seed, record_id, duplicate_index=0):
+    """The numpy Generator for one output record.
+
+    The stream is keyed by seed, the id of the master record and the index of
+    the output record among those generated from it, so the same record gets
+    the same random draws however the records are split into shards and
+    batches, and in whatever order they're processed.  By convention,
+    duplicate_index 0 is the stream of the master record itself, and the
+    corrupted records generated from it are numbered from 1
+    """
+    seed_sequence = np.random.SeedSequence(
+        entropy=seed, spawn_key=(record_key(record_id), duplicate_index)
+    )
+    return np.random.Generator(np.random.Philox(seed_sequence))
+
+
+def record_rngs(seed, record_ids, duplicate_indexes=None):
+    """A list of the Generators of many records, see record_rng"""
+    if duplicate_indexes is None:
+        duplicate_indexes = np.zeros(len(record_ids), dtype=np.int64)
+    return [
+        record_rng(seed, record_id, int(duplicate_index))
+        for record_id, duplicate_index in zip(record_ids, duplicate_indexes)
+    ]
+
+
+def get_rng(rng=None):
+    """rng, or if it's None, a new Generator seeded from the operating system,
+    for callers that don't need to be reproducible
+    """
+    if rng is None:
+        return np.random.default_rng()
+    return rng
+
+
+def uniforms(rng, size):
+    """An array of uniform draws in [0, 1) of shape size.
+
+    rng is a numpy Generator, or a list of Generators, one per record, in
+    which case the first dimension of size must be the number of records,
+    and each record's draws come from its own Generator
+    """
+    if isinstance(rng, list):
+        size = np.atleast_1d(size)
+        if size[0] != len(rng):
+            raise ValueError(
+                f"Expected {len(rng)} records, one per Generator, got size {size}"
+            )
+        per_record_size = tuple(size[1:])
+        draws = np.empty(tuple(size), dtype=np.float64)
+        for i, r in enumerate(rng):
+            draws[i] = r.random(per_record_size)
+        return draws
+    return rng.random(size)
+
+
+def select_rngs(rng, index):
+    """The Generators of the records at index, a boolean mask or array of
+    positions, if rng is a list of Generators, one per record.  Otherwise rng
+    itself, which is shared by all records
+    """
+    if not isinstance(rng, list):
+        return rng
+    index = np.asarray(index)
+    if index.dtype == bool:
+        index = np.flatnonzero(index)
+    return [rng[i] for i in index]
+
+
+def rngs_per_record(rng, num_records):
+    """A list of num_records Generators, one per record.  If rng is a single
+    Generator it's shared by all the records
+    """
+    if isinstance(rng, list):
+        return rng
+    return [get_rng(rng)] * num_records
@@ -0,0 +1,167 @@
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from corrupt.parquet_sink import ParquetRecordSink
+
+logger = logging.getLogger(__name__)
+
+
+# Each worker process builds its RecordCorruptor once, and keeps it here
+_worker_state = {}
+
+
+def shard_row_ranges(num_rows, num_shards):
+    """Split num_rows into num_shards contiguous (start, stop) row ranges"""
+    bounds = np.linspace(0, num_rows, num_shards + 1).astype(int)
+    return [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def iter_row_range(in_path, start, stop, batch_size):
+    """Stream rows [start, stop) of a parquet file as record batches of up to
+    batch_size rows, reading only the row groups that overlap the range, so
+    no more than about a batch is held in memory at once
+    """
+    parquet_file = pq.ParquetFile(in_path)
+    metadata = parquet_file.metadata
+
+    row_groups = []
+    first_row_of_row_groups = None
+    row_group_start = 0
+    for i in range(metadata.num_row_groups):
+        row_group_stop = row_group_start + metadata.row_group(i).num_rows
+        if row_group_start < stop and row_group_stop > start:
+            if first_row_of_row_groups is None:
+                first_row_of_row_groups = row_group_start
+            row_groups.append(i)
+        row_group_start = row_group_stop
+
+    if not row_groups:
+        return
+
+    # The position in the file of the first row of the next batch
+    batch_start = first_row_of_row_groups
+    batches = parquet_file.iter_batches(batch_size=batch_size, row_groups=row_groups)
+    for batch in batches:
+        batch_stop = batch_start + batch.num_rows
+        if batch_stop > start:
+            first = max(start - batch_start, 0)
+            last = min(stop, batch_stop) - batch_start
+            yield batch.slice(first, last - first)
+        batch_start = batch_stop
+        if batch_start >= stop:
+            break
+
+
+def shard_out_path(out_dir, shard_number):
+    return os.path.join(out_dir, f"part-{shard_number:05}.parquet")
+
+
+def _init_worker(build_record_corruptor):
+    _worker_state["record_corruptor"] = build_record_corruptor()
+
+
+def _corrupt_shard(
+    corrupt_records,
+    in_path,
+    out_dir,
+    shard_number,
+    row_range,
+    seed,
+    output_schema,
+    chunk_size,
+):
+    start_time = time.time()
+    rc = _worker_state["record_corruptor"]
+
+    start, stop = row_range
+
+    # Read and corrupt the shard a chunk at a time, streaming the output to
+    # disk, so memory use doesn't grow with the size of the shard
+    out_path = shard_out_path(out_dir, shard_number)
+    num_rows = 0
+    with ParquetRecordSink(out_path, output_schema) as sink:
+        for chunk in iter_row_range(in_path, start, stop, chunk_size):
+            sink.write_records(corrupt_records(chunk.to_pandas(), rc, seed))
+            num_rows += chunk.num_rows
+
+    time_taken = time.time() - start_time
+    return out_path, num_rows, sink.num_records_written, time_taken
+
+
+def run_sharded(
+    in_path,
+    out_dir,
+    build_record_corruptor,
+    corrupt_records,
+    num_shards=None,
+    num_workers=None,
+    seed=None,
+    output_schema=None,
+    chunk_size=10_000,
+):
+    """Corrupt the records in the parquet file at in_path in parallel.
+
+    The input is split into num_shards contiguous shards, which are corrupted
+    by a pool of num_workers processes.  Each worker calls
+    build_record_corruptor() once, and then corrupt_records(raw_data, rc, seed)
+    for each chunk of up to chunk_size records in each shard it is given,
+    where raw_data is a pandas dataframe.  The output of each shard is
+    streamed to its own parquet file in out_dir, with schema output_schema
+    (inferred from the first output if None).
+
+    Every shard is given the same seed, and corrupt_records should draw the
+    random numbers for each record from that record's own stream (see
+    corrupt.record_rng), so for a given seed the output is reproducible
+    regardless of num_shards, num_workers and chunk_size.  If seed is None, a
+    seed is chosen at random, and logged
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    if num_shards is None:
+        num_shards = num_workers * 4
+
+    num_rows = pq.ParquetFile(in_path).metadata.num_rows
+    num_shards = max(1, min(num_shards, num_rows))
+    row_ranges = shard_row_ranges(num_rows, num_shards)
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    logger.info(
+        f"Corrupting {num_rows:,} records in {num_shards} shards "
+        f"using {num_workers} workers, with seed {seed}"
+    )
+
+    out_paths = []
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_worker,
+        initargs=(build_record_corruptor,),
+    ) as executor:
+        futures = [
+            executor.submit(
+                _corrupt_shard,
+                corrupt_records,
+                in_path,
+                out_dir,
+                shard_number,
+                row_range,
+                seed,
+                output_schema,
+                chunk_size,
+            )
+            for shard_number, row_range in enumerate(row_ranges)
+        ]
+        for future in as_completed(futures):
+            out_path, num_in, num_out, time_taken = future.result()
+            logger.info(
+                f"Written {out_path} with {num_out:,} records from {num_in:,} "
+                f"input records in {time_taken:.1f}s"
+            )
+            out_paths.append(out_path)
+
+    return sorted(out_paths)
@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+
+import duckdb
+
+from path_fns.filepaths import DUCKDB_TEMP_DIR
+
+# The settings applied to every connection, and the environment variable that
+# overrides each of them
+SETTINGS_ENV_VARS = {
+    "threads": "DUCKDB_THREADS",
+    "memory_limit": "DUCKDB_MEMORY_LIMIT",
+    "temp_directory": "DUCKDB_TEMP_DIRECTORY",
+    "preserve_insertion_order": "DUCKDB_PRESERVE_INSERTION_ORDER",
+}
+
+# None means use DuckDB's default e.g. threads defaults to the number of cores,
+# and memory_limit to 80% of RAM
+DEFAULT_SETTINGS = {
+    "threads": None,
+    "memory_limit": None,
+    "temp_directory": DUCKDB_TEMP_DIR,
+    "preserve_insertion_order": False,
+}
+
+_lock = threading.Lock()
+_connection = None
+_connection_pid = None
+
+
+def duckdb_settings():
+    """The settings for new connections: the defaults, overridden by the
+    settings in the json file at DUCKDB_CONFIG, if set, e.g.
+
+    {"threads": 8, "memory_limit": "16GB"}
+
+    overridden in turn by the DUCKDB_* environment variables
+    """
+    settings = dict(DEFAULT_SETTINGS)
+
+    config_path = os.environ.get("DUCKDB_CONFIG")
+    if config_path:
+        with open(config_path) as f:
+            config = json.load(f)
+        unknown = set(config) - set(SETTINGS_ENV_VARS)
+        if unknown:
+            raise ValueError(f"Unknown DuckDB settings in {config_path}: {unknown}")
+        settings.update(config)
+
+    for setting, env_var in SETTINGS_ENV_VARS.items():
+        if env_var in os.environ:
+            settings[setting] = os.environ[env_var]
+
+    return settings
+
+
+def setting_literal(value):
+    if isinstance(value, bool):
+        value = str(value).lower()
+    value = str(value).replace("'", "''")
+    return f"'{value}'"
+
+
+def connect(database=":memory:", **settings):
+    """A new connection to database, with duckdb_settings() applied, overridden
+    by any settings passed in
+    """
+    settings = {**duckdb_settings(), **settings}
+    con = duckdb.connect(database)
+    for setting, value in settings.items():
+        if value is not None:
+            con.execute(f"SET {setting} = {setting_literal(value)}")
+    return con
+
+
+def get_connection():
+    """The in memory connection shared by everything in this process, created
+    on first use.  Worker processes each create their own.
+
+    The settings (e.g. the memory limit) apply to the whole database, so
+    code that registers tables, or is run from several threads, should use
+    get_connection().cursor(), which shares them but has its own tables
+    """
+    global _connection, _connection_pid
+    with _lock:
+        if _connection is None or _connection_pid != os.getpid():
+            _connection = connect()
+            _connection_pid = os.getpid()
+        return _connection
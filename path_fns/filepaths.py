@@ -8,19 +8,39 @@ NAMES = "names"
 
 
 PERSONS_BY_DOD_RAW_OUT_PATH = os.path.join(OUT_BASE, WIKIDATA, RAW, PERSONS, "by_dod")
+PERSONS_BY_DOD_RAW_STAGING_PATH = os.path.join(
+    OUT_BASE, WIKIDATA, RAW, PERSONS, "by_dod_staging"
+)
 NAMES_RAW_OUT_PATH_BASE = os.path.join(OUT_BASE, WIKIDATA, RAW, NAMES)
 NAMES_RAW_OUT_PATH_GIVEN_NAME = os.path.join(NAMES_RAW_OUT_PATH_BASE, "name_type=given")
 NAMES_RAW_OUT_PATH_FAMILY_NAME = os.path.join(
     NAMES_RAW_OUT_PATH_BASE, "name_type=family"
 )
 
+# Cache of raw http responses from the scrapers
+HTTP_CACHE_DIR = os.path.join(OUT_BASE, WIKIDATA, RAW, "http_cache")
+
+# Record of which units (dates, pages) of the scrapes have been completed
+SCRAPE_MANIFEST_PATH = os.path.join(OUT_BASE, WIKIDATA, RAW, "scrape_manifest.sqlite")
+
+
+# Raw persons files are hive partitioned by year of death e.g.
+# by_dod/dod_year=1999/dod_1999_02.parquet
+def persons_by_dod_raw_partition(year):
+    return os.path.join(PERSONS_BY_DOD_RAW_OUT_PATH, f"dod_year={year}")
+
 
 def persons_by_dob_raw_filename_year_month(year, month):
-    return os.path.join(PERSONS_BY_DOD_RAW_OUT_PATH, f"dod_{year}_{month:02}.parquet")
+    return os.path.join(
+        persons_by_dod_raw_partition(year), f"dod_{year}_{month:02}.parquet"
+    )
 
 
 def persons_by_dob_raw_filename_full_year(year):
-    return os.path.join(PERSONS_BY_DOD_RAW_OUT_PATH, f"dod_{year}_full.parquet")
+    return os.path.join(persons_by_dod_raw_partition(year), f"dod_{year}_full.parquet")
+
+
+PERSONS_BY_DOD_RAW_GLOB = os.path.join(PERSONS_BY_DOD_RAW_OUT_PATH, "*", "*.parquet")
 
 
 # Processed
@@ -40,6 +60,14 @@ NAMES_PROCESSED_FAMILY_NAME_ALT_LOOKUP = os.path.join(
     OUT_BASE, WIKIDATA, PROCESSED, "alt_name_lookups", "family_name_lookup.parquet"
 )
 
+# Memory mappable versions of the lookups, see corrupt/compact_name_lookup.py
+NAMES_PROCESSED_GIVEN_NAME_ALT_LOOKUP_COMPACT = os.path.join(
+    OUT_BASE, WIKIDATA, PROCESSED, "alt_name_lookups", "given_name_lookup_compact"
+)
+NAMES_PROCESSED_FAMILY_NAME_ALT_LOOKUP_COMPACT = os.path.join(
+    OUT_BASE, WIKIDATA, PROCESSED, "alt_name_lookups", "family_name_lookup_compact"
+)
+
 # Transformed master data
 TRANSFORMED = "transformed_master_data"
 TRANSFORMED_MASTER_DATA = os.path.join(
@@ -51,3 +79,13 @@ TRANSFORMED_MASTER_DATA = os.path.join(
 TRANSFORMED_MASTER_DATA_ONE_ROW_PER_PERSON = os.path.join(
     TRANSFORMED_MASTER_DATA, "one_row_per_person"
 )
+
+TRANSFORMED_MASTER_DATA_ONE_ROW_PER_PERSON_PARTS = os.path.join(
+    TRANSFORMED_MASTER_DATA_ONE_ROW_PER_PERSON, "parts"
+)
+
+# Where SQLPipeline writes intermediate tables that are too big to hold in memory
+SQL_PIPELINE_SPILL_DIR = os.path.join(OUT_BASE, "sql_pipeline_spill")
+
+# Where DuckDB spills to disk when a query needs more than its memory limit
+DUCKDB_TEMP_DIR = os.path.join(OUT_BASE, "duckdb_tmp")
@@ -0,0 +1,134 @@
+import random
+import socket
+import threading
+import time
+import logging
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+from SPARQLWrapper.SPARQLExceptions import EndPointInternalError
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes that mean 'try again later' rather than 'this query is bad'.
+# SPARQLWrapper raises EndPointInternalError rather than an HTTPError for a 500,
+# which is how WDQS reports a query timeout
+RETRYABLE_HTTP_CODES = {429, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread safe token bucket rate limiter.
+
+    Tokens are added at rate per second, up to capacity.  acquire() blocks
+    until a token is available, so no more than rate requests per second
+    (plus an initial burst of capacity) are made, however many threads share
+    the bucket
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, rate)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.last_refill) * self.rate
+        )
+        self.last_refill = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_retryable(e):
+    """Rate limiting, server errors and timeouts are worth retrying"""
+    if isinstance(e, EndPointInternalError):
+        return True
+    if isinstance(e, urllib.error.HTTPError):
+        return e.code in RETRYABLE_HTTP_CODES
+    return isinstance(
+        e, (urllib.error.URLError, socket.timeout, TimeoutError, ConnectionError)
+    )
+
+
+def retry_after_seconds(e):
+    """The delay requested by the server in a Retry-After header, if any"""
+    headers = getattr(e, "headers", None)
+    if headers is None:
+        return None
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_retries(fn, max_retries=6, base_delay=1.0, max_delay=120.0):
+    """Call fn(), retrying with exponential backoff and jitter if it raises a
+    retryable error.  If the server sends a Retry-After header, at least that
+    long is waited
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = min(max_delay, base_delay * 2**attempt)
+            delay = delay * (0.5 + random.random())
+            delay = max(delay, retry_after_seconds(e) or 0)
+            logger.warning(
+                f"Attempt {attempt + 1} failed with {e!r}, retrying in {delay:.1f}s"
+            )
+            time.sleep(delay)
+
+
+class ConcurrentScraper:
+    """Runs many queries against a SPARQL endpoint at once, with at most
+    max_workers requests in flight, no more than requests_per_second requests
+    started per second, and retries of requests that are rate limited or time
+    out
+    """
+
+    def __init__(
+        self,
+        max_workers=4,
+        requests_per_second=2.0,
+        max_retries=6,
+        base_delay=1.0,
+    ):
+        self.max_workers = max_workers
+        self.token_bucket = TokenBucket(requests_per_second)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+
+    def call(self, fn, *args):
+        """Call fn(*args) once a token is available, retrying if it's rate
+        limited or times out
+        """
+
+        def attempt():
+            self.token_bucket.acquire()
+            return fn(*args)
+
+        return call_with_retries(
+            attempt, max_retries=self.max_retries, base_delay=self.base_delay
+        )
+
+    def map(self, fn, *iterables):
+        """Like the builtin map, but calls fn concurrently, in max_workers
+        threads.  fn should make its requests with call, which rate limits and
+        retries them.  Results are yielded in the order of the inputs, as soon
+        as they are available
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            yield from executor.map(fn, *iterables)
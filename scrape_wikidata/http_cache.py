@@ -0,0 +1,141 @@
+import functools
+import gzip
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+from path_fns.filepaths import HTTP_CACHE_DIR
+
+
+class OfflineCacheMiss(Exception):
+    pass
+
+
+def normalise_query(query):
+    """Collapse whitespace, so reformatting a query doesn't change its key"""
+    return " ".join(query.split())
+
+
+class ResponseCache:
+    """Content addressed on disk cache of HTTP responses.
+
+    Responses are stored gzipped, in a file named by the sha256 of the parts
+    of their key e.g. (endpoint, normalised query).  Responses older than
+    ttl seconds are refetched, and once the cache is larger than max_bytes,
+    the least recently used responses are deleted.  In offline mode, a
+    response that isn't cached raises OfflineCacheMiss rather than being
+    fetched
+    """
+
+    def __init__(self, cache_dir, ttl=None, max_bytes=None, offline=False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.total_bytes = None
+
+    def path(self, key_parts):
+        digest = hashlib.sha256("\n".join(key_parts).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.gz")
+
+    def get(self, key_parts):
+        path = self.path(key_parts)
+        try:
+            modified = os.path.getmtime(path)
+            if self.ttl is not None and time.time() - modified > self.ttl:
+                return None
+            with open(path, "rb") as f:
+                data = gzip.decompress(f.read())
+        except FileNotFoundError:
+            return None
+
+        # Record the access for eviction, keeping the modified time for the ttl
+        os.utime(path, (time.time(), modified))
+        return data
+
+    def put(self, key_parts, data):
+        path = self.path(key_parts)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        # Write then rename, so readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(gzip.compress(data))
+
+        if self.max_bytes is None:
+            os.replace(tmp_path, path)
+            return
+
+        with self.lock:
+            # A response being overwritten e.g. after its ttl no longer counts
+            try:
+                old_size = os.path.getsize(path)
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(tmp_path, path)
+            if self.total_bytes is None:
+                self.total_bytes = sum(st.st_size for _, st in self._entries())
+            else:
+                self.total_bytes += os.path.getsize(path) - old_size
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith(".gz"):
+                    path = os.path.join(dirpath, filename)
+                    yield path, os.stat(path)
+
+    def evict(self, target_fraction=0.9):
+        """Delete the least recently used responses until the cache is below
+        target_fraction of max_bytes
+        """
+        entries = sorted(self._entries(), key=lambda e: e[1].st_atime)
+        total_bytes = sum(stat.st_size for _, stat in entries)
+        for path, stat in entries:
+            if total_bytes <= self.max_bytes * target_fraction:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= stat.st_size
+        self.total_bytes = total_bytes
+
+    def fetch(self, key_parts, fetch_fn):
+        """Return the cached response for key_parts, calling fetch_fn() to get
+        and cache it if there isn't one
+        """
+        data = self.get(key_parts)
+        if data is not None:
+            return data
+
+        if self.offline:
+            raise OfflineCacheMiss(f"No cached response for {key_parts}")
+
+        data = fetch_fn()
+        self.put(key_parts, data)
+        return data
+
+
+@functools.lru_cache(maxsize=None)
+def get_response_cache():
+    """The cache used by the scrapers, configured by environment variables:
+
+    SCRAPE_CACHE_DIR: where responses are stored
+    SCRAPE_CACHE_TTL_DAYS: refetch responses older than this (default never)
+    SCRAPE_CACHE_MAX_GB: evict responses when the cache is larger than this
+    SCRAPE_OFFLINE: if 1, only use cached responses
+    """
+    ttl_days = os.environ.get("SCRAPE_CACHE_TTL_DAYS")
+    max_gb = os.environ.get("SCRAPE_CACHE_MAX_GB")
+    return ResponseCache(
+        os.environ.get("SCRAPE_CACHE_DIR", HTTP_CACHE_DIR),
+        ttl=float(ttl_days) * 24 * 60 * 60 if ttl_days else None,
+        max_bytes=float(max_gb) * 1e9 if max_gb else None,
+        offline=os.environ.get("SCRAPE_OFFLINE") == "1",
+    )
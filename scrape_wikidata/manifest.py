@@ -0,0 +1,170 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+def file_checksum(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ScrapeManifest:
+    """Records each completed unit of a scrape (e.g. a date of death, or a
+    page of names) in a SQLite table, with the number of rows it returned,
+    the file the rows were written to and that file's checksum.
+
+    Each unit is committed as soon as it completes, so a scrape that is
+    stopped can be resumed from exactly where it got to.  Each unit can also
+    carry a small dict of metadata e.g. the keyset cursor of the next page
+    """
+
+    def __init__(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.execute(
+            """
+            create table if not exists completed_units (
+                scrape text not null,
+                unit text not null,
+                num_rows integer not null,
+                path text,
+                checksum text,
+                completed_at real not null,
+                metadata text,
+                primary key (scrape, unit)
+            )
+            """
+        )
+        columns = [
+            row[1] for row in self.con.execute("pragma table_info(completed_units)")
+        ]
+        if "metadata" not in columns:
+            self.con.execute("alter table completed_units add column metadata text")
+        self.con.commit()
+
+    def completed_units(self, scrape):
+        with self.lock:
+            rows = self.con.execute(
+                "select unit from completed_units where scrape = ?", (scrape,)
+            ).fetchall()
+        return {unit for (unit,) in rows}
+
+    def is_complete(self, scrape, unit):
+        with self.lock:
+            row = self.con.execute(
+                "select 1 from completed_units where scrape = ? and unit = ?",
+                (scrape, unit),
+            ).fetchone()
+        return row is not None
+
+    def units(self, scrape):
+        """All the completed units of scrape, as a list of
+        (unit, num_rows, path, metadata) tuples, where metadata is the dict
+        recorded with the unit, if any
+        """
+        with self.lock:
+            rows = self.con.execute(
+                """
+                select unit, num_rows, path, metadata from completed_units
+                where scrape = ?
+                """,
+                (scrape,),
+            ).fetchall()
+        return [
+            (unit, num_rows, path, json.loads(metadata) if metadata else None)
+            for unit, num_rows, path, metadata in rows
+        ]
+
+    def paths(self, scrape, units):
+        """The distinct files the rows of units were written to"""
+        units = list(units)
+        with self.lock:
+            rows = self.con.execute(
+                f"""
+                select distinct path from completed_units
+                where scrape = ? and unit in ({", ".join("?" * len(units))})
+                order by path
+                """,
+                (scrape, *units),
+            ).fetchall()
+        return [path for (path,) in rows]
+
+    def record(self, scrape, units, path=None, checksum=None, metadata=None):
+        """Mark units complete.  units is a dict of unit -> number of rows,
+        all of which were written to path.  metadata is an optional dict
+        recorded with each unit e.g. where to resume from
+        """
+        if path is not None and checksum is None:
+            checksum = file_checksum(path)
+        if metadata is not None:
+            metadata = json.dumps(metadata)
+        completed_at = time.time()
+        with self.lock:
+            self.con.executemany(
+                """
+                insert or replace into completed_units
+                (scrape, unit, num_rows, path, checksum, completed_at, metadata)
+                values (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (scrape, unit, num_rows, path, checksum, completed_at, metadata)
+                    for unit, num_rows in units.items()
+                ],
+            )
+            self.con.commit()
+
+    def clear(self, scrape):
+        """Forget all the completed units of scrape"""
+        with self.lock:
+            self.con.execute("delete from completed_units where scrape = ?", (scrape,))
+            self.con.commit()
+
+    def summary(self, scrape):
+        """(number of units, number of rows) completed so far"""
+        with self.lock:
+            num_units, num_rows = self.con.execute(
+                """
+                select count(*), coalesce(sum(num_rows), 0)
+                from completed_units where scrape = ?
+                """,
+                (scrape,),
+            ).fetchone()
+        return num_units, num_rows
+
+
+class ProgressReporter:
+    """Reports how many units of a scrape are done, and the throughput of
+    this run
+    """
+
+    def __init__(self, total_units, already_done=0):
+        self.total_units = total_units
+        self.done = already_done
+        self.done_this_run = 0
+        self.rows_this_run = 0
+        self.start_time = time.time()
+
+    def update(self, num_units, num_rows):
+        self.done += num_units
+        self.done_this_run += num_units
+        self.rows_this_run += num_rows
+
+    def report(self):
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        units_per_second = self.done_this_run / elapsed
+        message = (
+            f"{self.done:,}/{self.total_units:,} units done, "
+            f"{units_per_second:.2f} units/s, "
+            f"{self.rows_this_run / elapsed:.1f} rows/s"
+        )
+        if units_per_second > 0:
+            remaining = (self.total_units - self.done) / units_per_second
+            message += f", about {remaining / 60:.0f} minutes remaining"
+        return message
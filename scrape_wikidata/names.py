@@ -1,5 +1,14 @@
+import re
 import requests
-from scrape_wikidata.query_wikidata import replace_url, query_with_offset
+import pyarrow.compute as pc
+from scrape_wikidata.http_cache import get_response_cache
+from scrape_wikidata.query_wikidata import (
+    ENTITY_URL_PREFIX,
+    call_directly,
+    decode_sparql_json,
+    endpoint_url,
+    get_results_bytes,
+)
 import pandas as pd
 import duckdb
 
@@ -49,7 +58,7 @@ WITH {
 as %results
 
 WHERE {
-  INCLUDE %results.get_given_name_weighted_lookup
+  INCLUDE %results.
   SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
 }
 """
@@ -96,17 +105,11 @@ RENAMES = {
 }
 
 
-def get_standardised_table(query, name_variant, page=0, pagesize=5000):
-
-    df = query_with_offset(
-        query,
-        page,
-        pagesize,
-    )
+def standardise_table(table, name_variant):
+    df = table.to_pandas()
     df["name_variant_type"] = name_variant
 
     df = df.rename(columns=RENAMES)
-    df = df.applymap(replace_url)
 
     if len(df.columns) == 4:
         return df
@@ -114,15 +117,96 @@ def get_standardised_table(query, name_variant, page=0, pagesize=5000):
         raise ValueError("df does not contain 4 cols")
 
 
+def keyset_page_query(query, entity_var, pagesize, after_entity=None):
+    """Template one of the name queries to return a page of results ordered by
+    entity_var, starting from after_entity (inclusive), in place of its
+    LIMIT 100
+    """
+    if after_entity is None:
+        page_filter = ""
+    else:
+        page_filter = (
+            f'  FILTER(STR(?{entity_var}) >= "{ENTITY_URL_PREFIX}{after_entity}")\n'
+        )
+
+    # Insert the filter at the end of the where clause that the limit applies
+    # to, and order by the key
+    return re.sub(
+        r"\}(\s*)LIMIT 100",
+        lambda m: (
+            f"{page_filter}}}{m.group(1)}ORDER BY STR(?{entity_var})"
+            f"{m.group(1)}LIMIT {pagesize}"
+        ),
+        query,
+        count=1,
+    )
+
+
+def query_keyset_page(
+    query, entity_var, pagesize, after_entity=None, call=call_directly
+):
+    """Get a page of results, returning (table, next_entity), where
+    next_entity is where the next page starts, or None if this is the last page.
+
+    The rows of the last entity in a full page may be incomplete, so they are
+    dropped, and the next page starts from that entity.  call(fn, *args)
+    makes the request if it isn't cached
+    """
+    this_query = keyset_page_query(query, entity_var, pagesize, after_entity)
+    raw = get_results_bytes(endpoint_url, this_query, call=call)
+    table = decode_sparql_json(raw, strip_entity_urls=True)
+    if len(table) < pagesize:
+        return table, None
+
+    last_entity = pc.max(table[entity_var]).as_py()
+    table = table.filter(pc.not_equal(table[entity_var], last_entity))
+    if len(table) == 0:
+        raise ValueError(f"{last_entity} alone has at least {pagesize} rows")
+    return table, last_entity
+
+
+def get_standardised_pages(
+    query,
+    name_variant,
+    entity_var,
+    pagesize=5000,
+    after_entity=None,
+    call=call_directly,
+):
+    """Page through all the results of one of the name queries, by keyset on
+    entity_var (an entity id column of the query) rather than OFFSET, which
+    gets slower with every page.
+
+    Yields (df, next_entity) for each page, stopping after the last page.
+    Pass the next_entity of the last page done as after_entity to resume.
+    call(fn, *args) makes each request that isn't cached e.g.
+    ConcurrentScraper.call
+    """
+    while True:
+        table, next_entity = query_keyset_page(
+            query, entity_var, pagesize, after_entity, call=call
+        )
+        yield standardise_table(table, name_variant), next_entity
+        if next_entity is None:
+            return
+        after_entity = next_entity
+
+
 def get_diminutives():
     url1 = "https://raw.githubusercontent.com/jonathanhar/diminutives.db/master/male_diminutives.csv"
     url2 = "https://raw.githubusercontent.com/jonathanhar/diminutives.db/master/female_diminutives.csv"
 
     urls = [url1, url2]
+
+    def fetch(url):
+        r = requests.get(url)
+        r.raise_for_status()
+        return r.content
+
     rows = []
     for url in urls:
-        r = requests.get(url)
-        for line in r.text.splitlines():
+        text = get_response_cache().fetch(("GET", url), lambda: fetch(url))
+        for line in text.decode("utf-8").splitlines():
             elems = line.split(",")
             original_name = elems.pop(0)
             for e in elems:
@@ -1,42 +1,68 @@
 from SPARQLWrapper import SPARQLWrapper, JSON
+import io
+import json
+import os
 import sys
-import pandas as pd
+from collections import namedtuple
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pa_json
 
-endpoint_url = "https://query.wikidata.org/sparql"
+from scrape_wikidata.http_cache import get_response_cache, normalise_query
+
+# Can be pointed at a local stand in endpoint e.g. for testing the scrapers
+endpoint_url = os.environ.get(
+    "WIKIDATA_SPARQL_ENDPOINT", "https://query.wikidata.org/sparql"
+)
+
+# The columns returned by QUERY_HUMAN, in order.  This is the single place
+# scraped person columns are declared: QUERY_HUMAN's select list, the raw
+# persons schema and the one row per person aggregation in step 03 are all
+# generated from it.
+#
+# transform is how step 03 cleans the column: 'entity' strips the wikidata
+# url from entity ids, 'date' casts it to a date, and None keeps it as is.
+# Columns with aggregate=False are scraped, but not kept by step 03
+PersonColumn = namedtuple(
+    "PersonColumn", ["name", "transform", "aggregate"], defaults=[None, True]
+)
+
+PERSON_COLUMNS = [
+    PersonColumn("human", "entity"),
+    PersonColumn("humanLabel"),
+    PersonColumn("humanAltLabel"),
+    PersonColumn("dob", "date"),
+    PersonColumn("dod", "date"),
+    PersonColumn("birth_name"),
+    PersonColumn("given_name", "entity"),
+    PersonColumn("given_nameLabel"),
+    PersonColumn("family_name", "entity"),
+    PersonColumn("family_nameLabel"),
+    PersonColumn("name_native_language"),
+    PersonColumn("humanDescription"),
+    PersonColumn("pseudonym"),
+    PersonColumn("place_birth", "entity"),
+    PersonColumn("place_birthLabel"),
+    PersonColumn("occupation", "entity"),
+    PersonColumn("occupationLabel"),
+    PersonColumn("ethnicity", "entity"),
+    PersonColumn("ethnicityLabel"),
+    PersonColumn("residence", "entity"),
+    PersonColumn("residenceLabel"),
+    PersonColumn("country_citizen", "entity"),
+    PersonColumn("country_citizenLabel"),
+    PersonColumn("country_citizenLabelAlt", aggregate=False),
+    PersonColumn("sex_or_genderLabel"),
+    PersonColumn("birth_coordinates"),
+    PersonColumn("birth_country", "entity"),
+    PersonColumn("birth_countryLabel"),
+    PersonColumn("residence_coordinates"),
+    PersonColumn("residence_countryLabel"),
+]
 
 QUERY_HUMAN = """
 SELECT
-    ?human
-    ?humanLabel
-    ?humanAltLabel
-    ?dob
-    ?dod
-    ?birth_name
-    ?given_name
-    ?given_nameLabel
-    ?family_name
-    ?family_nameLabel
-    ?name_native_language
-    ?humanDescription
-    ?pseudonym
-    ?place_birth
-    ?place_birthLabel
-    ?occupation
-    ?occupationLabel
-    ?ethnicity
-    ?ethnicityLabel
-    ?residence
-    ?residenceLabel
-    ?country_citizen
-    ?country_citizenLabel
-    ?country_citizenLabelAlt
-    ?sex_or_genderLabel
-    ?birth_coordinates
-    ?birth_country
-    ?birth_countryLabel
-    ?residence_coordinates
-    ?residence_countryLabel
-
+{select_columns}
 WITH {
 SELECT
     ?human
@@ -90,35 +116,279 @@ WHERE {
   SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
 }
 LIMIT 3000
-"""
+""".replace(
+    "{select_columns}", "\n".join(f"    ?{col.name}" for col in PERSON_COLUMNS)
+)
+
+# All raw persons files are written with this schema, so they can be read
+# together without any schema merging
+QUERY_HUMAN_COLUMNS = [col.name for col in PERSON_COLUMNS]
+PERSONS_RAW_SCHEMA = pa.schema([(col, pa.string()) for col in QUERY_HUMAN_COLUMNS])
+
 
+def conform_to_schema(table, schema):
+    """Select and cast the columns of table to match schema, adding columns
+    that are missing as nulls
+    """
+    columns = []
+    for field in schema:
+        if field.name in table.column_names:
+            columns.append(table[field.name].cast(field.type))
+        else:
+            columns.append(pa.nulls(len(table), field.type))
+    return pa.table(columns, schema=schema)
 
-def get_results(endpoint_url, query):
+
+def fetch_results_bytes(endpoint_url, query, timeout=None):
     user_agent = "WDQS-example Python/%s.%s" % (
         sys.version_info[0],
         sys.version_info[1],
     )
     sparql = SPARQLWrapper(endpoint_url, agent=user_agent)
+    if timeout is not None:
+        sparql.setTimeout(timeout)
     sparql.setQuery(query)
     sparql.setReturnFormat(JSON)
     query_returned = sparql.query()
-    return query_returned.convert()
+    return query_returned.response.read()
 
 
-def get_value_from_result(x):
-    try:
-        return x["value"]
-    except:
-        return None
+def call_directly(fn, *args):
+    return fn(*args)
+
+
+def get_results_bytes(endpoint_url, query, timeout=None, call=call_directly):
+    """The raw SPARQL JSON response to query, from the response cache if it
+    has been fetched before.  Otherwise it's fetched by call(fn, *args) e.g.
+    ConcurrentScraper.call, so only requests that miss the cache wait to be
+    rate limited
+    """
+    return get_response_cache().fetch(
+        (endpoint_url, normalise_query(query)),
+        lambda: call(fetch_results_bytes, endpoint_url, query, timeout),
+    )
+
 
+def get_results(endpoint_url, query, timeout=None):
+    return json.loads(get_results_bytes(endpoint_url, query, timeout))
 
-def query_with_date(query, date):
+
+ENTITY_URL_PREFIX = "http://www.wikidata.org/entity/"
+
+SPARQL_HEAD_SCHEMA = pa.schema([("head", pa.struct([("vars", pa.list_(pa.string()))]))])
+
+
+def read_json_document(raw, schema):
+    """Parse the fields in schema from the json document raw with arrow's json
+    reader, ignoring any others.  The reader is line oriented, so the whole
+    document is read as one block, and may be pretty printed
+    """
+    return pa_json.read_json(
+        io.BytesIO(raw),
+        read_options=pa_json.ReadOptions(block_size=len(raw) + 1),
+        parse_options=pa_json.ParseOptions(
+            explicit_schema=schema,
+            newlines_in_values=True,
+            unexpected_field_behavior="ignore",
+        ),
+    )
+
+
+def decode_sparql_json(raw, strip_entity_urls=False):
+    """Decode a SPARQL JSON response into an arrow table with a string column
+    for each variable in the query, in the order they were selected.
+
+    The response is parsed by arrow's json reader, and the value of each
+    variable is taken from the bindings a column at a time, so no Python
+    object is made per cell.  The selected variables are read first, so the
+    bindings can be parsed with an explicit schema, as otherwise values that
+    look like dates would be read as timestamps.  If strip_entity_urls,
+    wikidata entity urls are shortened to their ids e.g. Q42
+    """
+    head = read_json_document(raw, SPARQL_HEAD_SCHEMA)
+    variables = head.column("head")[0]["vars"].as_py()
+
+    binding = pa.struct(
+        [(var, pa.struct([("value", pa.string())])) for var in variables]
+    )
+    schema = pa.schema([("results", pa.struct([("bindings", pa.list_(binding))]))])
+    results = read_json_document(raw, schema).column("results")
+    bindings = pc.list_flatten(pc.struct_field(results, "bindings"))
+
+    columns = {}
+    for var in variables:
+        values = pc.struct_field(pc.struct_field(bindings, var), "value")
+        if strip_entity_urls:
+            values = pc.replace_substring(values, ENTITY_URL_PREFIX, "")
+        columns[var] = values
+    return pa.table(
+        columns, schema=pa.schema([(var, pa.string()) for var in variables])
+    )
+
+
+def query_with_date(query, date, endpoint_url=endpoint_url, timeout=None):
 
     this_query = query.replace("0000-00-00", date)
-    results = get_results(endpoint_url, this_query)
-    df = pd.DataFrame(results["results"]["bindings"])
-    df = df.applymap(get_value_from_result)
-    return df
+    return decode_sparql_json(get_results_bytes(endpoint_url, this_query, timeout))
+
+
+# QUERY_HUMAN returns at most this many rows.  A result this size may have
+# been truncated
+PERSONS_QUERY_LIMIT = 3000
+
+DOD_VALUES_TEMPLATE = 'VALUES ?dod {"+0000-00-00"^^xsd:dateTime}'
+INNER_QUERY_END = "}\nLIMIT 3000\n} AS %results"
+
+
+def dod_values_clause(dates):
+    values = " ".join(f'"+{d}"^^xsd:dateTime' for d in dates)
+    return f"VALUES ?dod {{{values}}}"
+
+
+def persons_query_for_dates(query, dates, limit=PERSONS_QUERY_LIMIT, after_human=None):
+    """Template QUERY_HUMAN to return the persons who died on any of dates.
+
+    If after_human is given, results are ordered by ?human, and only humans
+    from after_human onwards (inclusive) are returned, so that a date with
+    more than limit rows can be paged through by keyset
+    """
+    this_query = query.replace(DOD_VALUES_TEMPLATE, dod_values_clause(dates))
+
+    if after_human is not None:
+        this_query = this_query.replace(
+            INNER_QUERY_END,
+            f'  FILTER(STR(?human) >= "{after_human}")\n'
+            f"}}\nORDER BY STR(?human)\nLIMIT 3000\n}} AS %results",
+        )
+
+    return this_query.replace("LIMIT 3000", f"LIMIT {limit}")
+
+
+def query_with_dates(
+    query,
+    dates,
+    endpoint_url=endpoint_url,
+    timeout=None,
+    limit=PERSONS_QUERY_LIMIT,
+    after_human=None,
+    call=call_directly,
+):
+    this_query = persons_query_for_dates(query, dates, limit, after_human)
+    raw = get_results_bytes(endpoint_url, this_query, timeout, call=call)
+    return decode_sparql_json(raw)
+
+
+def query_date_in_pages(
+    query, date, limit=PERSONS_QUERY_LIMIT, call=call_directly, **kwargs
+):
+    """Scrape a date with more than limit rows, by keyset paging on ?human.
+
+    The rows of the last human in a full page may be incomplete, so they are
+    dropped, and the next page starts from that human.  call(fn, *args) makes
+    each request that isn't cached e.g. ConcurrentScraper.call
+    """
+    tables = []
+    after_human = ""
+    while True:
+        table = query_with_dates(
+            query, [date], limit=limit, after_human=after_human, call=call, **kwargs
+        )
+        if len(table) < limit:
+            tables.append(table)
+            return pa.concat_tables(tables)
+
+        last_human = pc.max(table["human"]).as_py()
+        table = table.filter(pc.not_equal(table["human"], last_human))
+        if len(table) == 0:
+            raise ValueError(f"{last_human} alone has at least {limit} rows")
+        tables.append(table)
+        after_human = last_human
+
+
+class DateBatchPlanner:
+    """Decides how many dates to scrape in each request.
+
+    Keeps a moving average of the number of rows per date in recent results,
+    and packs dates into batches expected to return target_fill * limit
+    rows, so sparse dates share a request, but busy dates are unlikely to hit
+    the limit
+    """
+
+    def __init__(
+        self,
+        limit=PERSONS_QUERY_LIMIT,
+        target_fill=0.5,
+        max_dates_per_batch=366,
+        smoothing=0.3,
+    ):
+        self.limit = limit
+        self.target_fill = target_fill
+        self.max_dates_per_batch = max_dates_per_batch
+        self.smoothing = smoothing
+        self.rows_per_date = None
+
+    def batch_size(self):
+        # Until something has been scraped, assume dates are busy
+        if self.rows_per_date is None:
+            return 1
+        size = self.limit * self.target_fill / max(self.rows_per_date, 1e-3)
+        return int(min(max(size, 1), self.max_dates_per_batch))
+
+    def plan(self, dates):
+        size = self.batch_size()
+        return [dates[i : i + size] for i in range(0, len(dates), size)]
+
+    def record(self, num_dates, num_rows):
+        rows_per_date = num_rows / num_dates
+        if self.rows_per_date is None:
+            self.rows_per_date = rows_per_date
+        else:
+            self.rows_per_date = (
+                self.smoothing * rows_per_date
+                + (1 - self.smoothing) * self.rows_per_date
+            )
+
+
+def scrape_dates_adaptive(
+    query, dates, planner, map_fn=map, call=call_directly, on_batch=None, **kwargs
+):
+    """Scrape the persons who died on dates, in as few requests as the planner
+    allows.  A batch of dates whose result hits the limit is split in two and
+    re-scraped, and a single date that hits it is paged through.
+
+    map_fn is used to run each round of requests concurrently e.g.
+    ConcurrentScraper.map, and call(fn, *args) to make each request that
+    isn't cached e.g. ConcurrentScraper.call, so it is rate limited and
+    retried.
+    on_batch(batch, table) is called as the complete result for each batch
+    of dates arrives e.g. to checkpoint it.  kwargs are passed to
+    query_with_dates.  Returns a list of arrow tables
+    """
+
+    def query_batch(batch):
+        return query_with_dates(query, batch, limit=planner.limit, call=call, **kwargs)
+
+    tables = []
+    pending = planner.plan(dates)
+    while pending:
+        next_pending = []
+        for batch, table in zip(pending, map_fn(query_batch, pending)):
+            if len(table) >= planner.limit and len(batch) > 1:
+                mid = len(batch) // 2
+                next_pending.extend([batch[:mid], batch[mid:]])
+                continue
+
+            if len(table) >= planner.limit:
+                table = query_date_in_pages(
+                    query, batch[0], planner.limit, call=call, **kwargs
+                )
+            planner.record(len(batch), len(table))
+            tables.append((batch[0], table))
+            if on_batch is not None:
+                on_batch(batch, table)
+        pending = next_pending
+
+    return [table for _, table in sorted(tables, key=lambda t: t[0])]
 
 
 def replace_url(x):
@@ -126,13 +396,3 @@ def replace_url(x):
         return x.replace("http://www.wikidata.org/entity/", "")
     except:
         return x
-
-
-def query_with_offset(query, page=0, pagesize=500):
-    limit_offset = f" limit {pagesize} offset {page*pagesize}"
-    this_query = query.replace("LIMIT 100", limit_offset)
-    print(this_query)
-    results = get_results(endpoint_url, this_query)
-    df = pd.DataFrame(results["results"]["bindings"])
-    df = df.applymap(get_value_from_result)
-    return df
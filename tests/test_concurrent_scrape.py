@@ -0,0 +1,53 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from scrape_wikidata.concurrent_scrape import ConcurrentScraper
+from scrape_wikidata.query_wikidata import fetch_results_bytes
+
+RESULTS = {"head": {"vars": ["human"]}, "results": {"bindings": []}}
+
+
+@pytest.fixture
+def endpoint():
+    """A stand in SPARQL endpoint which times out (HTTP 500, as WDQS does) on
+    the first request, and succeeds after that
+    """
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            if len(requests) == 1:
+                self.send_response(500)
+                self.end_headers()
+                self.wfile.write(b"java.util.concurrent.TimeoutException")
+                return
+            body = json.dumps(RESULTS).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/sparql-results+json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/sparql", requests
+    server.shutdown()
+    server.server_close()
+
+
+def test_server_timeout_is_retried(endpoint):
+    url, requests = endpoint
+    scraper = ConcurrentScraper(requests_per_second=100, base_delay=0.01)
+
+    raw = scraper.call(fetch_results_bytes, url, "SELECT ?human WHERE {}")
+
+    assert json.loads(raw) == RESULTS
+    assert len(requests) == 2
@@ -0,0 +1,34 @@
+import os
+
+from scrape_wikidata import query_wikidata
+from scrape_wikidata.http_cache import ResponseCache
+
+
+def test_overwriting_a_response_does_not_grow_the_cache_size(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=10**9)
+    cache.put(("a",), b"first response")
+    cache.put(("b",), b"another response")
+    for _ in range(3):
+        cache.put(("a",), b"a refetched response")
+
+    on_disk = sum(
+        os.path.getsize(os.path.join(dirpath, f))
+        for dirpath, _, filenames in os.walk(tmp_path)
+        for f in filenames
+    )
+    assert cache.total_bytes == on_disk
+
+
+def test_cached_responses_are_not_requested(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path))
+    monkeypatch.setattr(query_wikidata, "get_response_cache", lambda: cache)
+    calls = []
+
+    def call(fn, *args):
+        calls.append(args)
+        return b"response"
+
+    for _ in range(3):
+        raw = query_wikidata.get_results_bytes("endpoint", "SELECT ?x", call=call)
+        assert raw == b"response"
+    assert len(calls) == 1
@@ -0,0 +1,39 @@
+import duckdb
+import pytest
+
+from transform_master_data.pipeline import PARQUET, TABLE, SQLPipeline
+
+
+def temp_tables(con):
+    return con.execute(
+        "select table_name from information_schema.tables where table_catalog = 'temp'"
+    ).fetchall()
+
+
+def pipeline(con, spill_dir, final_sql):
+    pipeline = SQLPipeline(con, spill_dir=str(spill_dir))
+    pipeline.enqueue_sql("select range as x from range(10)", "numbers", PARQUET)
+    pipeline.enqueue_sql("select x * 2 as y from numbers", "doubled", TABLE)
+    pipeline.enqueue_sql(final_sql, "final")
+    return pipeline
+
+
+def test_spilled_and_temporary_outputs_are_removed(tmp_path):
+    con = duckdb.connect()
+    sql = "select sum(y) as total, (select count(*) from numbers) as n from doubled"
+
+    result = pipeline(con, tmp_path, sql).execute_pipeline()
+
+    assert result.to_pylist() == [{"total": 90, "n": 10}]
+    assert list(tmp_path.iterdir()) == []
+    assert temp_tables(con) == []
+
+
+def test_outputs_are_removed_if_the_pipeline_fails(tmp_path):
+    con = duckdb.connect()
+
+    with pytest.raises(duckdb.Error):
+        pipeline(con, tmp_path, "select no_such_column from doubled").execute_pipeline()
+
+    assert list(tmp_path.iterdir()) == []
+    assert temp_tables(con) == []
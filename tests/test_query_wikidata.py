@@ -0,0 +1,51 @@
+import json
+
+from scrape_wikidata.query_wikidata import decode_sparql_json
+
+RESPONSE = {
+    "head": {"vars": ["human", "dod", "name", "unbound"]},
+    "results": {
+        "bindings": [
+            {
+                "human": {"type": "uri", "value": "http://www.wikidata.org/entity/Q1"},
+                "dod": {
+                    "datatype": "http://www.w3.org/2001/XMLSchema#dateTime",
+                    "type": "literal",
+                    "value": "2000-01-01T00:00:00Z",
+                },
+                "name": {"xml:lang": "en", "type": "literal", "value": 'Zoë "Q"'},
+            },
+            {"human": {"type": "uri", "value": "http://www.wikidata.org/entity/Q2"}},
+        ]
+    },
+}
+
+
+def test_decode_sparql_json():
+    # WDQS pretty prints its responses
+    raw = json.dumps(RESPONSE, indent=2, ensure_ascii=False).encode("utf-8")
+
+    table = decode_sparql_json(raw, strip_entity_urls=True)
+
+    assert table.column_names == ["human", "dod", "name", "unbound"]
+    assert all(str(t) == "string" for t in table.schema.types)
+    assert table.to_pylist() == [
+        {
+            "human": "Q1",
+            "dod": "2000-01-01T00:00:00Z",
+            "name": 'Zoë "Q"',
+            "unbound": None,
+        },
+        {"human": "Q2", "dod": None, "name": None, "unbound": None},
+    ]
+
+
+def test_decode_sparql_json_without_results():
+    raw = json.dumps(
+        {"head": {"vars": ["human"]}, "results": {"bindings": []}}
+    ).encode()
+
+    table = decode_sparql_json(raw)
+
+    assert table.column_names == ["human"]
+    assert table.num_rows == 0
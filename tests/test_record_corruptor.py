@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from corrupt.record_corruptor import CompositeCorruption, RecordCorruptor
+
+
+def upper_name(formatted_master_record, record_to_modify, rng=None):
+    name = formatted_master_record["name"]
+    record_to_modify["name"] = None if pd.isnull(name) else name.upper()
+    return record_to_modify
+
+
+def upper_name_batch(formatted_master_batch, batch_to_modify, rng=None):
+    names = formatted_master_batch["name"]
+    batch_to_modify["name"] = np.where(pd.isnull(names), None, names.str.upper())
+    return batch_to_modify
+
+
+def corrupt(batch_fn):
+    rc = RecordCorruptor()
+    corruption = CompositeCorruption(name="upper", baseline_probability=1.0)
+    corruption.add_corruption_function(upper_name, args={}, batch_fn=batch_fn)
+    rc.add_composite_corruption(corruption)
+
+    # The null is NaN, as in a dataframe read from csv, and the corruption
+    # functions write None
+    master = pd.DataFrame({"name": ["anna", np.nan]})
+    records = master.copy()
+    return rc.apply_corruptions_to_batch(
+        master, records, np.array([1.0]), rng=np.random.default_rng(0)
+    )
+
+
+def test_null_input_left_null_is_not_recorded_as_corrupted():
+    for batch_fn in [upper_name_batch, None]:
+        corrupted = corrupt(batch_fn)
+        assert corrupted["name"].tolist()[0] == "ANNA"
+        assert pd.isnull(corrupted["name"].tolist()[1])
+        assert corrupted["corruptions_applied"].tolist() == [["upper"], []]
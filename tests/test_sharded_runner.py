@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from corrupt.parquet_sink import ParquetRecordSink
+from corrupt.record_corruptor import CompositeCorruption, RecordCorruptor
+from corrupt.record_rng import record_rngs
+from corrupt.sharded_runner import iter_row_range, run_sharded, shard_row_ranges
+
+NUM_ROWS = 500
+
+OUTPUT_SCHEMA = pa.schema(
+    [
+        ("id", pa.int64()),
+        ("name", pa.string()),
+        ("corruptions_applied", pa.list_(pa.string())),
+    ]
+)
+
+
+@pytest.fixture
+def in_path(tmp_path):
+    path = tmp_path / "master.parquet"
+    table = pa.table(
+        {
+            "id": np.arange(NUM_ROWS),
+            "name": [f"name{i}" for i in range(NUM_ROWS)],
+        }
+    )
+    # Several row groups, so shards and chunks don't line up with them
+    pq.write_table(table, path, row_group_size=64)
+    return str(path)
+
+
+def append_random_letter(formatted_master_record, record_to_modify, rng=None):
+    letter = "abcdefghijklmnopqrstuvwxyz"[rng.integers(26)]
+    record_to_modify["name"] = formatted_master_record["name"] + letter
+    return record_to_modify
+
+
+def build_record_corruptor():
+    rc = RecordCorruptor()
+    corruption = CompositeCorruption(name="letter", baseline_probability=0.5)
+    corruption.add_corruption_function(append_random_letter, args={})
+    rc.add_composite_corruption(corruption)
+    return rc
+
+
+def corrupt_records(raw_data, rc, seed):
+    rngs = record_rngs(seed, raw_data["id"].tolist())
+    return rc.apply_corruptions_to_batch(raw_data, raw_data.copy(), rng=rngs)
+
+
+def fail_on_record_300(raw_data, rc, seed):
+    if (raw_data["id"] == 300).any():
+        raise ValueError("record 300")
+    return corrupt_records(raw_data, rc, seed)
+
+
+def read_output(out_paths):
+    return pa.concat_tables(pq.read_table(p) for p in out_paths).sort_by("id")
+
+
+def test_shards_cover_every_row_once():
+    for num_rows, num_shards in [(10, 3), (500, 7), (3, 3)]:
+        ranges = shard_row_ranges(num_rows, num_shards)
+        assert len(ranges) == num_shards
+        rows = [i for start, stop in ranges for i in range(start, stop)]
+        assert rows == list(range(num_rows))
+
+
+def test_output_does_not_depend_on_workers_shards_or_chunks(in_path, tmp_path):
+    outputs = []
+    for num_workers, num_shards, chunk_size in [(2, 3, 50), (1, 1, 1000)]:
+        out_dir = tmp_path / f"out_{num_workers}_{num_shards}"
+        out_dir.mkdir()
+        out_paths = run_sharded(
+            in_path,
+            str(out_dir),
+            build_record_corruptor,
+            corrupt_records,
+            num_shards=num_shards,
+            num_workers=num_workers,
+            seed=7,
+            output_schema=OUTPUT_SCHEMA,
+            chunk_size=chunk_size,
+        )
+        assert len(out_paths) == num_shards
+        outputs.append(read_output(out_paths))
+
+    assert outputs[0].num_rows == NUM_ROWS
+    assert 0 < sum(len(c) for c in outputs[0]["corruptions_applied"].to_pylist())
+    assert outputs[0].equals(outputs[1])
+
+
+def test_failed_shard_leaves_no_parquet_file(in_path, tmp_path):
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+
+    with pytest.raises(ValueError, match="record 300"):
+        run_sharded(
+            in_path,
+            str(out_dir),
+            build_record_corruptor,
+            fail_on_record_300,
+            num_shards=2,
+            num_workers=1,
+            seed=7,
+            output_schema=OUTPUT_SCHEMA,
+            chunk_size=50,
+        )
+
+    # Shard 0 is rows 0-249 and succeeds, shard 1 fails part way through
+    assert sorted(p.name for p in out_dir.iterdir()) == ["part-00000.parquet"]
+
+
+def test_aborted_sink_leaves_no_file(tmp_path):
+    out_path = tmp_path / "part.parquet"
+    records = pd.DataFrame({"id": range(10)})
+
+    with pytest.raises(ValueError):
+        with ParquetRecordSink(str(out_path), buffer_size=5) as sink:
+            # The first write is flushed to the temporary file
+            sink.write_records(records)
+            raise ValueError("failed part way through")
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_row_range_is_streamed_in_batches(in_path, monkeypatch):
+    row_groups_read = []
+    iter_batches = pq.ParquetFile.iter_batches
+
+    def recording_iter_batches(self, *args, row_groups=None, **kwargs):
+        row_groups_read.extend(row_groups)
+        return iter_batches(self, *args, row_groups=row_groups, **kwargs)
+
+    monkeypatch.setattr(pq.ParquetFile, "iter_batches", recording_iter_batches)
+
+    batches = list(iter_row_range(in_path, 100, 300, batch_size=30))
+
+    assert all(batch.num_rows <= 30 for batch in batches)
+    ids = [i for batch in batches for i in batch.column("id").to_pylist()]
+    assert ids == list(range(100, 300))
+    # Only the row groups of 64 rows overlapping rows 100-299 are read
+    assert row_groups_read == [1, 2, 3, 4]
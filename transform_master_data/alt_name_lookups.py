@@ -1,8 +1,66 @@
 from .pipeline import SQLPipeline
 
 
+def create_name_frequency_counts(
+    con,
+    raw_name_cols,
+    tablename_scraped_one_row_per_person,
+    output_table_name="scraped_name_frequency_counts",
+    sample_percent=None,
+):
+    """
+    Create a temporary table of the number of times each name appears in each
+    of raw_name_cols, in a single scan of the scraped data, so it can be
+    shared by the lookups of each type of name:
+    | name_col         | name  | count |
+    |:-----------------|:------|:------|
+    | given_nameLabel  | john  | 51234 |
+    | family_nameLabel | smith | 20345 |
+
+    If sample_percent is given, the names of a random sample of that percent
+    of people are counted, and the counts scaled up.  This is much quicker for
+    very large scrapes, but the counts are approximate, so names near the
+    threshold of get_name_weighted_lookup may be included or excluded
+    """
+
+    names_per_col = [
+        f"list_transform({col}, x -> struct_pack(name_col := '{col}', name := x))"
+        for col in raw_name_cols
+    ]
+    names = names_per_col[0]
+    for n in names_per_col[1:]:
+        names = f"list_concat({names}, {n})"
+
+    if sample_percent is None:
+        source = tablename_scraped_one_row_per_person
+        count = "count(*)"
+    else:
+        source = f"""
+        {tablename_scraped_one_row_per_person}
+        using sample {sample_percent} percent (bernoulli)"""
+        count = f"cast(round(count(*) * 100.0 / {sample_percent}) as bigint)"
+
+    # Names are counted per spelling, and then lower cased, so a name can
+    # appear more than once e.g. 'John' and 'JOHN'
+    sql = f"""
+    create or replace temp table {output_table_name} as
+    with all_names as (
+        select unnest({names}) as n
+        from {source}
+    )
+    select n.name_col as name_col, lower(n.name) as name, {count} as count
+    from all_names
+    group by n.name_col, n.name
+    """
+    con.execute(sql)
+
+
 def get_name_weighted_lookup(
-    con, raw_name_col, tablename_alt_names, tablename_scraped_one_row_per_person
+    con,
+    raw_name_col,
+    tablename_alt_names,
+    tablename_scraped_one_row_per_person,
+    tablename_name_frequency_counts=None,
 ):
     """
     Get a table that is a lookup between original names and weighted alternatives:
@@ -10,6 +68,9 @@ def get_name_weighted_lookup(
     |:----------------|:----------------------------------|:-------------------------|
     | jody            | ['joseph', 'joe', 'judith', 'jo'] | [0.43, 0.23, 0.16, 0.16] |
 
+    The name frequencies are taken from tablename_name_frequency_counts, a
+    table made by create_name_frequency_counts, if given, otherwise they are
+    counted from tablename_scraped_one_row_per_person
     """
 
     # The table 'name_frequency_counts' contains a count of
@@ -17,18 +78,25 @@ def get_name_weighted_lookup(
 
     pipeline = SQLPipeline(con)
 
-    sql = f"""
-    select unnest({raw_name_col}) as name
-    from {tablename_scraped_one_row_per_person}
-    """
-    pipeline.enqueue_sql(sql, "all_names")
-
-    sql = """
-    select lower(name) as name, count(*) as count
-    from all_names
-    group by name
-    order by count desc
-    """
+    if tablename_name_frequency_counts is None:
+        sql = f"""
+        select unnest({raw_name_col}) as name
+        from {tablename_scraped_one_row_per_person}
+        """
+        pipeline.enqueue_sql(sql, "all_names")
+
+        sql = """
+        select lower(name) as name, count(*) as count
+        from all_names
+        group by name
+        order by count desc
+        """
+    else:
+        sql = f"""
+        select name, count
+        from {tablename_name_frequency_counts}
+        where name_col = '{raw_name_col}'
+        """
 
     pipeline.enqueue_sql(sql, "name_frequency_counts")
 
@@ -116,4 +184,5 @@ def get_name_weighted_lookup(
 
     # Run this to see intermediate outputs
     # return pipeline.execute_pipeline_in_parts()
+    # or pipeline.profile_pipeline() to time each stage
     return pipeline.execute_pipeline()
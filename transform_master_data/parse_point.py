@@ -1,38 +1,109 @@
-def parse_point_to_lat_lng(
-    pipeline, colname_to_replace, output_table_name, input_table_name="df"
+# Wikidata coordinates are WKT points, with longitude first e.g.
+# Point(-0.1275 51.507222222)
+POINT_REGEX = r"^\s*Point\(\s*(\S+)\s+(\S+)\s*\)\s*$"
+
+COMPACT_TYPES = {"float32": "FLOAT", "float64": "DOUBLE"}
+
+
+def grid_cell_sql(lat, lng, cell_size_degrees):
+    """SQL for the id of the cell of a regular lat/lng grid a point falls in,
+    numbered row by row from (-90, -180), or null if the point is null
+    """
+    num_rows = int(-(-180 // cell_size_degrees))
+    num_cols = int(-(-360 // cell_size_degrees))
+
+    # Points on or outside the edge of the grid go in the nearest cell
+    def cell_index(coord, offset, num_cells):
+        index = f"floor(({coord} + {offset}) / {cell_size_degrees})"
+        return f"greatest(least({index}, {num_cells - 1}), 0)"
+
+    row = cell_index(lat, 90, num_rows)
+    col = cell_index(lng, 180, num_cols)
+    return f"""
+                case when {lat} is null or {lng} is null then null
+                else cast({row} * {num_cols} + {col} as bigint) end"""
+
+
+def parse_points_to_lat_lng(
+    pipeline,
+    colnames,
+    output_table_name,
+    input_table_name="df",
+    compact_type=None,
+    cell_size_degrees=None,
 ):
+    """Replace each of colnames, a list of WKT points, with a list of
+    {lat, lng} structs of doubles, in a single pass over the table.  Each
+    point is parsed with one regex, and points that can't be parsed become
+    {lat: null, lng: null}.
 
-    intermediate_df_name_1 = f"space_delimited_coordinates_{colname_to_replace}"
+    If compact_type is 'float32' or 'float64', a column {colname}_compact is
+    added for each column, with the coordinates as a flat list of that type,
+    [lat_1, lng_1, lat_2, lng_2, ...].
 
-    sql = f"""
-    select
-        * exclude ({colname_to_replace}),
-        list_transform({colname_to_replace}, x ->
-            replace(
-                replace(x, 'Point(', ''),
-                ')', ''))
-            as {colname_to_replace}
-    from {input_table_name}
+    If cell_size_degrees is given, a column {colname}_cell is added for each
+    column, with the id of the grid cell of that size each point falls in, for
+    bucketing points spatially
     """
-    pipeline.enqueue_sql(sql, intermediate_df_name_1)
+    if compact_type is not None and compact_type not in COMPACT_TYPES:
+        raise ValueError(
+            f"compact_type must be one of {list(COMPACT_TYPES)}, got {compact_type!r}"
+        )
+
+    parsed_cols = []
+    extra_cols = []
+    for colname in colnames:
+        parsed_cols.append(
+            f"""
+        list_transform(
+            list_transform({colname}, x ->
+                regexp_extract(x, '{POINT_REGEX}', ['lng', 'lat'])),
+            p -> struct_pack(
+                lat := try_cast(p.lat as double),
+                lng := try_cast(p.lng as double)))
+            as {colname}"""
+        )
+
+        if compact_type is not None:
+            extra_cols.append(
+                f"""
+        cast(flatten(list_transform({colname}, p -> [p.lat, p.lng]))
+            as {COMPACT_TYPES[compact_type]}[])
+            as {colname}_compact"""
+            )
+
+        if cell_size_degrees is not None:
+            cell = grid_cell_sql("p.lat", "p.lng", cell_size_degrees)
+            extra_cols.append(
+                f"""
+        list_transform({colname}, p -> {cell})
+            as {colname}_cell"""
+            )
 
-    intermediate_df_name_2 = f"space_delimited_coordinates_2_{colname_to_replace}"
     sql = f"""
     select
-        * exclude ({colname_to_replace}),
-        list_transform({colname_to_replace}, x -> str_split(x, ' '))
-            as {colname_to_replace}
-    from {intermediate_df_name_1}
+        * exclude ({", ".join(colnames)}),
+        {",".join(parsed_cols)}
+    from {input_table_name}
     """
-    pipeline.enqueue_sql(sql, intermediate_df_name_2)
 
-    sql = f"""
+    # The compact and cell columns are derived from the parsed coordinates
+    if extra_cols:
+        pipeline.enqueue_sql(sql, f"{output_table_name}_parsed_points")
+        sql = f"""
     select
-        * exclude ({colname_to_replace}),
-        list_transform({colname_to_replace}, x -> struct_pack(lat :=try_cast(x[2] as double), lng:=try_cast(x[1] as double)))
-            as {colname_to_replace}
-    from {intermediate_df_name_2}
+        *,
+        {",".join(extra_cols)}
+    from {output_table_name}_parsed_points
     """
 
     pipeline.enqueue_sql(sql, output_table_name)
     return pipeline
+
+
+def parse_point_to_lat_lng(
+    pipeline, colname_to_replace, output_table_name, input_table_name="df"
+):
+    return parse_points_to_lat_lng(
+        pipeline, [colname_to_replace], output_table_name, input_table_name
+    )
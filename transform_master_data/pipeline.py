@@ -1,51 +1,242 @@
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+
+from path_fns.filepaths import SQL_PIPELINE_SPILL_DIR
+
+# How the output of a task is made available to the tasks that use it
+INLINE = "inline"  # a CTE in the SQL of each later task
+TABLE = "table"  # a temporary table, computed once and held in memory
+PARQUET = "parquet"  # a parquet file in the spill directory, computed once
+AUTO = "auto"  # chosen by how often the output is used, and its estimated size
+
+MATERIALISATIONS = [INLINE, TABLE, PARQUET, AUTO]
+
+# The profile of one task of a pipeline executed in parts.  explain_analyze
+# is the text of DuckDB's EXPLAIN ANALYZE of the task, if it was requested
+StageProfile = namedtuple(
+    "StageProfile",
+    ["output_table_name", "seconds", "num_rows", "num_bytes", "explain_analyze"],
+)
+
+
 class SQLTask:
-    def __init__(self, sql, output_table_name):
+    def __init__(self, sql, output_table_name, materialise=AUTO):
+        if materialise not in MATERIALISATIONS:
+            raise ValueError(
+                f"materialise must be one of {MATERIALISATIONS}, got {materialise!r}"
+            )
         self.sql = sql
         self.output_table_name = output_table_name
+        self.materialise = materialise
+
+
+def with_ctes(tasks, sql):
+    """Prefix sql with a WITH clause defining the output of each task"""
+    with_parts = [f"{p.output_table_name} as ({p.sql})" for p in tasks]
+    with_parts = ", \n".join(with_parts)
+    if with_parts:
+        with_parts = f"WITH {with_parts} "
+    return with_parts + sql
+
+
+def estimated_rows(con, sql):
+    """The number of rows DuckDB's planner estimates sql will return, or None
+    if the plan has no estimate
+    """
+    plan = "\n".join(row[1] for row in con.execute(f"EXPLAIN {sql}").fetchall())
+    # Newer versions of DuckDB print e.g. '~20,000 rows', older ones 'EC: 20000'
+    match = re.search(r"~([\d,]+) rows|EC: ?(\d+)", plan)
+    if match is None:
+        return None
+    return int((match.group(1) or match.group(2)).replace(",", ""))
+
+
+def format_profile(stages):
+    """A plain text table of the stages of a profile, slowest first"""
+    total_seconds = sum(stage.seconds for stage in stages) or 1e-9
+    name_width = max([len("stage")] + [len(s.output_table_name) for s in stages])
+    lines = [f"{'stage':<{name_width}} {'seconds':>9} {'%':>5} {'rows':>13} {'MB':>9}"]
+    for stage in sorted(stages, key=lambda s: s.seconds, reverse=True):
+        lines.append(
+            f"{stage.output_table_name:<{name_width}} "
+            f"{stage.seconds:>9.3f} "
+            f"{100 * stage.seconds / total_seconds:>5.1f} "
+            f"{stage.num_rows:>13,} "
+            f"{stage.num_bytes / 1e6:>9.1f}"
+        )
+    return "\n".join(lines)
 
 
 class SQLPipeline:
-    def __init__(self, con):
+    """A queue of SQL statements, each of which can select from the outputs of
+    the statements before it.
+
+    When the pipeline is executed, the output of each task is either inlined
+    as a CTE, or computed once into a temporary table or a parquet file.  By
+    default (AUTO), outputs used by only one later task are inlined, so DuckDB
+    can stream through them, and outputs used by several later tasks are
+    computed once rather than once per use, spilling to parquet if they are
+    estimated to have more than spill_rows rows
+    """
+
+    def __init__(
+        self,
+        con,
+        materialise=AUTO,
+        spill_dir=SQL_PIPELINE_SPILL_DIR,
+        spill_rows=5_000_000,
+    ):
         self.con = con
         self.queue = []
+        self.materialise = materialise
+        self.spill_dir = spill_dir
+        self.spill_rows = spill_rows
+        self.profile = []
 
-    def enqueue_sql(self, sql, output_table_name):
-        sql_task = SQLTask(sql, output_table_name)
+    def enqueue_sql(self, sql, output_table_name, materialise=None):
+        if materialise is None:
+            materialise = self.materialise
+        sql_task = SQLTask(sql, output_table_name, materialise)
         self.queue.append(sql_task)
 
     def generate_pipelined_sql(self):
+        return with_ctes(self.queue[:-1], self.queue[-1].sql)
 
-        with_parts = self.queue[:-1]
-        last_part = self.queue[-1]
+    def num_uses(self, task_index):
+        name = self.queue[task_index].output_table_name
+        pattern = re.compile(rf"\b{re.escape(name)}\b")
+        return sum(1 for t in self.queue[task_index + 1 :] if pattern.search(t.sql))
 
-        with_parts = [f"{p.output_table_name} as ({p.sql})" for p in with_parts]
-        with_parts = ", \n".join(with_parts)
-        if with_parts:
-            with_parts = f"WITH {with_parts} "
+    def choose_materialisation(self, task_index, sql):
+        materialise = self.queue[task_index].materialise
+        if materialise != AUTO:
+            return materialise
 
-        final_sql = with_parts + last_part.sql
+        if self.num_uses(task_index) <= 1:
+            return INLINE
 
-        return final_sql
+        rows = estimated_rows(self.con, sql)
+        if rows is not None and rows > self.spill_rows:
+            return PARQUET
+        return TABLE
 
-    def execute_pipeline_in_parts(self):
-        for sql_task in self.queue:
+    def drop_temp(self, name):
+        """Drop the temporary table or view called name, if there is one e.g.
+        from a previous run of the pipeline
+        """
+        rows = self.con.execute(
+            """
+            select table_type from information_schema.tables
+            where table_catalog = 'temp' and table_name = ?
+            """,
+            [name],
+        ).fetchall()
+        for (table_type,) in rows:
+            kind = "VIEW" if table_type == "VIEW" else "TABLE"
+            self.con.execute(f"DROP {kind} {name}")
+
+    def materialise_task(self, task, sql, materialise, run_spill_dir):
+        name = task.output_table_name
+        self.drop_temp(name)
+
+        if materialise == TABLE:
+            self.con.execute(f"CREATE TEMP TABLE {name} AS {sql}")
+        elif materialise == PARQUET:
+            path = os.path.join(run_spill_dir, f"{name}.parquet")
+            self.con.execute(f"COPY ({sql}) TO '{path}' (FORMAT 'parquet')")
+            self.con.execute(
+                f"CREATE TEMP VIEW {name} AS SELECT * FROM read_parquet('{path}')"
+            )
+
+    def execute_task(self, sql_task, explain_analyze=False):
+        """Execute one task on its own, returning its output as an arrow table
+        along with its StageProfile.  EXPLAIN ANALYZE runs the task a second
+        time, so it's only run if requested, and isn't included in the timing
+        """
+        start_time = time.perf_counter()
+        df_arrow = self.con.execute(sql_task.sql).fetch_arrow_table()
+        seconds = time.perf_counter() - start_time
 
-            print("---")
-            print(sql_task.output_table_name)
-            print(sql_task.sql)
+        plan = None
+        if explain_analyze:
+            rows = self.con.execute(f"EXPLAIN ANALYZE {sql_task.sql}").fetchall()
+            plan = "\n".join(row[1] for row in rows)
 
-            df_arrow = self.con.execute(sql_task.sql).fetch_arrow_table()
+        stage = StageProfile(
+            sql_task.output_table_name,
+            seconds,
+            df_arrow.num_rows,
+            df_arrow.nbytes,
+            plan,
+        )
+        return df_arrow, stage
+
+    def execute_pipeline_in_parts(self, verbose=True, explain_analyze=False):
+        """Execute each task separately, holding its output in memory as an
+        arrow table, so intermediate results can be inspected.  The profile of
+        each task is recorded in self.profile.  If verbose, the SQL, the time
+        taken and the first few rows of each task are printed
+        """
+        self.profile = []
+        for sql_task in self.queue:
+            df_arrow, stage = self.execute_task(sql_task, explain_analyze)
+            self.profile.append(stage)
+
+            self.drop_temp(sql_task.output_table_name)
             self.con.register(sql_task.output_table_name, df_arrow)
 
-            df_to_show = self.con.execute(
-                f"select * from {sql_task.output_table_name} limit 5"
-            ).fetch_df()
-            display(df_to_show)
+            if verbose:
+                print("---")
+                print(sql_task.output_table_name)
+                print(sql_task.sql)
+                print(
+                    f"{stage.seconds:.3f}s, {stage.num_rows:,} rows, "
+                    f"{stage.num_bytes / 1e6:.1f} MB"
+                )
+                print(df_arrow.slice(0, 5).to_pandas().to_string())
         return df_arrow.to_pandas()
 
+    def profile_pipeline(self, explain_analyze=True):
+        """Execute the pipeline in parts, without printing, and return the
+        StageProfile of each task e.g. to find which is the bottleneck.  Use
+        format_profile to summarise it
+        """
+        self.execute_pipeline_in_parts(verbose=False, explain_analyze=explain_analyze)
+        return self.profile
+
     def execute_pipeline(self):
-        sql = self.generate_pipelined_sql()
-        return self.con.execute(sql)
+        """Execute the pipeline, returning the output of the last task as an
+        arrow table.  The temporary tables and spilled parquet files of the
+        other tasks are deleted once it has been fetched.  Spilled files are
+        written to a directory of their own in spill_dir, so pipelines run at
+        the same time don't overwrite each other's
+        """
+        os.makedirs(self.spill_dir, exist_ok=True)
+        run_spill_dir = tempfile.mkdtemp(dir=self.spill_dir)
+        materialised = []
+        try:
+            # Inlined outputs stay in the WITH clause of every later statement,
+            # which DuckDB ignores if they're not referenced
+            ctes = []
+            for i, sql_task in enumerate(self.queue[:-1]):
+                sql = with_ctes(ctes, sql_task.sql)
+                materialise = self.choose_materialisation(i, sql)
+                if materialise == INLINE:
+                    ctes.append(sql_task)
+                else:
+                    materialised.append(sql_task.output_table_name)
+                    self.materialise_task(sql_task, sql, materialise, run_spill_dir)
+
+            sql = with_ctes(ctes, self.queue[-1].sql)
+            return self.con.execute(sql).fetch_arrow_table()
+        finally:
+            for name in materialised:
+                self.drop_temp(name)
+            shutil.rmtree(run_spill_dir, ignore_errors=True)
 
     def reset(self):
         self.queue = []
@@ -1,4 +1,4 @@
-import duckdb
+from path_fns.duckdb_connection import get_connection
 from transform_master_data.pipeline import SQLPipeline
 
 
@@ -6,7 +6,7 @@ def tokens_in_full_name_not_in_given_family_name():
 
     path = "out_data/wikidata/processed/one_row_per_person/raw_scraped_one_row_per_person.parquet"
 
-    con = duckdb.connect()
+    con = get_connection().cursor()
 
     pipeline = SQLPipeline(con)
 
@@ -76,5 +76,5 @@ def tokens_in_full_name_not_in_given_family_name():
     order by token_count desc
     """
     pipeline.enqueue_sql(sql, "tokens_in_human_label_not_in_given_family_names")
-    df = pipeline.execute_pipeline().df()
+    df = pipeline.execute_pipeline().to_pandas()
     return df